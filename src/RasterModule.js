@@ -0,0 +1,77 @@
+/*
+Canvas for visualization.RasterGrid: the terrain image arrives once per model and is kept, and every frame updates
+only the wolves and trackers the server says have changed before redrawing everything over the image.
+*/
+var RasterModule = function(canvas_width, canvas_height, grid_width, grid_height) {
+	var canvas = $(`<canvas width="${canvas_width}" height="${canvas_height}" class="world-grid"/>`)[0];
+	var parent = $('<div style="height:' + canvas_height + 'px;" class="world-grid-parent"></div>')[0];
+	$("#elements").append(parent);
+	parent.append(canvas);
+	var context = canvas.getContext("2d");
+
+	var cellWidth = canvas_width / grid_width;
+	var cellHeight = canvas_height / grid_height;
+	var maxR = Math.min(cellWidth, cellHeight) / 2;
+	// wolf states as visualization.py numbers them: alive, detected, dead
+	var wolfColors = ["black", "red", "blue"];
+
+	var background = null;
+	var sites = [];
+	var trackerPositions = [];
+	var wolves = [];
+	var trackers = [];
+
+	var circle = function(x, y, r, color, fill) {
+		context.beginPath();
+		// y grows upwards, as in CanvasGrid
+		context.arc((x + 0.5) * cellWidth, (grid_height - y - 0.5) * cellHeight, r, 0, Math.PI * 2, false);
+		context.closePath();
+		context.strokeStyle = color;
+		context.stroke();
+		if (fill) {
+			context.fillStyle = color;
+			context.fill();
+		}
+	};
+
+	var draw = function() {
+		context.clearRect(0, 0, canvas_width, canvas_height);
+		if (background !== null && background.complete) {
+			context.imageSmoothingEnabled = false;
+			context.drawImage(background, 0, 0, canvas_width, canvas_height);
+		}
+		sites.forEach(site => circle(site[0], site[1], 10 * maxR, "green", false));
+		trackers.forEach(function(active, index) {
+			var tracker = trackerPositions[index];
+			// an active tracker's circle has r = its range, scaled as CanvasGrid scales agent_portrayal's r
+			var r = (active ? tracker[2] : 5) * maxR;
+			context.globalAlpha = active ? 0.4 : 1;
+			circle(tracker[0], tracker[1], r, "yellow", true);
+			context.globalAlpha = 1;
+		});
+		// dead wolves first, detected ones on top
+		[2, 0, 1].forEach(state => wolves.forEach(function(wolf) {
+			if (wolf[2] === state)
+				circle(wolf[0], wolf[1], 3 * maxR, wolfColors[state], true);
+		}));
+	};
+
+	this.render = function(data) {
+		if (data.background !== undefined) {
+			background = new Image();
+			background.onload = draw;
+			background.src = data.background;
+			sites = data.sites;
+			trackerPositions = data.tracker_positions;
+			wolves = [];
+			trackers = [];
+		}
+		data.wolves.forEach(wolf => wolves[wolf[0]] = wolf.slice(1));
+		data.trackers.forEach(tracker => trackers[tracker[0]] = tracker[1]);
+		draw();
+	};
+
+	this.reset = function() {
+		context.clearRect(0, 0, canvas_width, canvas_height);
+	};
+};
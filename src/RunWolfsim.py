@@ -1,23 +1,35 @@
-import matplotlib.pyplot as plt
-from mesa.batchrunner import BatchRunner
-from mesa.visualization.modules import CanvasGrid
-from mesa.visualization.ModularVisualization import ModularServer
-from mesa.visualization.modules import ChartModule
 from datetime import datetime
 import numpy as np
-from WolfsimModel import WolfModel, compute_pack_health, compute_pack_position, \
-    compute_est_pack_position, agent_portrayal, home_range, compute_track_error, compute_track_error_average
-from utils import readASCII
+from WolfsimModel import WolfModel
+from utils import compute_pack_health, compute_track_error_average, home_range
+from terrain import load_terrain, TerrainContext
+from batchrun import ParallelBatchRunner
+from adaptive import AdaptiveBatchRunner
+# plotting, the Mesa visualization server and the result sinks are imported by the runs that use them
 
 
-def sim_run(width, height, elev_cells, veg_cells, tracking_type, save=False):
+def sim_run(width, height, elev_cells, veg_cells, tracking_type, save=False, show_paths=False):
+    import matplotlib.pyplot as plt
+    import pandas as pd
+    from plotting import PathPlotter
+    from sinks import open_sink, AGENT_SCHEMA, MODEL_SCHEMA
+
     iterations = 1
     tf = 365*1
     wolfpack_size = 25
     all_ages = []
+    if save:
+        # per-wolf and per-day records are streamed to disk in row groups instead of kept until the end
+        time = datetime.now().strftime("%m_%d_%H_%M")
+        agent_sink = open_sink("results/WolfSim_Results_{}".format(time), AGENT_SCHEMA)
+        model_sink = open_sink("results/WolfSim_Pack_{}".format(time), MODEL_SCHEMA)
     for j in range(iterations):
         model = WolfModel(wolfpack_size, width, height, elev_cells, veg_cells,
                           tracking_type=tracking_type, plot_movement=False)
+        if show_paths:
+            PathPlotter().attach(model)
+        if save:
+            model.datacollector.stream_to(agent_sink, model_sink, run=j)
         for i in range(tf):
             model.step()
         for agent in model.schedule.agents:
@@ -42,41 +54,59 @@ def sim_run(width, height, elev_cells, veg_cells, tracking_type, save=False):
 
     # wolfpack_health = model.datacollector.get_model_vars_dataframe()
     # wolfpack_health.plot()
-    wolfpack_data = model.datacollector.get_agent_vars_dataframe()
     wolfsim_data = model.datacollector.get_model_vars_dataframe()
-    # wolfpack_data.plot()
-    # Selecting data from final step of wolves
-    startpoint = -wolfpack_size + 1
-    last_set_all = wolfpack_data.iloc[startpoint:]
+    if save:
+        agent_sink.close()
+        model_sink.close()
+    # Wolves at the final step of the last run, from the model itself so that a streamed history is not read back
+    final_wolves = model.datacollector.sample_wolves(model)
+    last_set_all = pd.DataFrame({"Alive": final_wolves["Alive"], "Age": final_wolves["Age"]})
     last_set = last_set_all[last_set_all.Alive]
     print("Average wolf age at final step that is living: {}".format(np.average(last_set[last_set.Alive==True]["Age"])))
     print("Number of wolves that have died: {}".format(len(last_set[last_set.Alive==False])))
     # plt.show()
     # print(last_set)
 
-    if save:
-        time = datetime.now().strftime("%m_%d_%H_%M")
-        wolfpack_data.to_csv("results/WolfSim_Results_{}.csv".format(time))
-
     kernel = True
     if kernel:
-        home_range(wolfsim_data)
+        ranges = home_range(wolfsim_data, width, height, plot=True)
+        for name, estimate in ranges.items():
+            print("{} home range: {}".format(name, ", ".join("{}%: {:.0f} cells".format(p, a)
+                                                           for p, a in zip(estimate.percents, estimate.areas))))
+        plt.show()
 
 
-def batch_run(width, height, elev_cells, veg_cells):
+def batch_run(width, height, elev_cells, veg_cells, processes=None, store=None, output=None, ensemble=False,
+              precision=None):
+    import matplotlib.pyplot as plt
+    from sinks import open_sink
+
+    # every model in the sweep shares one read-only copy of the terrain and its path planning structures
+    terrain = TerrainContext.get(elev_cells, veg_cells, width, height)
     fixed_params = {"width": width, "height": height, "elev": elev_cells, "veg": veg_cells,
-                    "N": 25}
+                    "terrain": terrain}
     variable_params = {"N": range(10, 50, 1), "tracking_type": ['satellite', 'planes', 'helicopters', 'stations']}
     # variable_params = {"tracking_type": ['satellite', 'planes', 'helicopters', 'stations']}
 
-    batch_run = BatchRunner(WolfModel,
-                            variable_params,
-                            fixed_params,
-                            iterations=30,
-                            max_steps=365,
-                            model_reporters={"pack_health": compute_pack_health,
-                                             "track_error": compute_track_error_average})
+    options = dict(max_steps=365,
+                   model_reporters={"pack_health": compute_pack_health,
+                                    "track_error": compute_track_error_average},
+                   processes=processes,
+                   store=store,  # e.g. "batch_runs.jsonl" to resume an interrupted sweep
+                   sink=open_sink(output) if output else None,  # stream run records to disk
+                   keep_records=output is None,
+                   ensemble=ensemble)  # run the iterations of a point in lockstep
+    if precision is None:
+        batch_run = ParallelBatchRunner(WolfModel, variable_params, fixed_params, iterations=30, **options)
+    else:
+        # e.g. {"track_error": 0.5, "pack_health": 0.01}: runs go to the points until their means are that precise,
+        # within the budget of the fixed sweep
+        points = np.prod([len(values) for values in variable_params.values()])
+        batch_run = AdaptiveBatchRunner(WolfModel, variable_params, fixed_params, targets=precision,
+                                        budget=30 * points, **options)
     batch_run.run_all()
+    if precision is not None:
+        print(batch_run.get_convergence_dataframe().to_string())
 
     run_data = batch_run.get_model_vars_dataframe()
     run_data.head()
@@ -86,8 +116,55 @@ def batch_run(width, height, elev_cells, veg_cells):
     plt.show()
 
 
+def design_run(width, height, elev_cells, veg_cells, n=32, iterations=1, processes=None, ensemble=False):
+    # Sobol indices of the average track error over pack size, collars and the trackers' range, timer and type,
+    # from a Saltelli design of n * 7 points instead of a full grid
+    from design import SensitivityDesign, Continuous, Integer, Categorical
+
+    terrain = TerrainContext.get(elev_cells, veg_cells, width, height)
+    fixed_params = {"width": width, "height": height, "elev": elev_cells, "veg": veg_cells,
+                    "terrain": terrain}
+    space = {"N": Integer(10, 49), "n_collars": Integer(1, 5), "tracker_dist": Continuous(50, 150),
+             "tracker_timer": Integer(1, 10),
+             "tracking_type": Categorical(['satellite', 'planes', 'helicopters', 'stations'])}
+    design = SensitivityDesign(space, n)
+    batch_run = ParallelBatchRunner(WolfModel, fixed_parameters=fixed_params, points=design.points,
+                                    iterations=iterations, max_steps=365,
+                                    model_reporters={"pack_health": compute_pack_health,
+                                                     "track_error": compute_track_error_average},
+                                    processes=processes, ensemble=ensemble)
+    batch_run.run_all()
+    run_data = batch_run.get_model_vars_dataframe()
+    print(design.indices_dataframe(run_data, "track_error", iterations).to_string())
+    return run_data
+
+
+def placement_run(width, height, elev_cells, veg_cells, tracking_type="stations", counts=range(1, 8), runs=16,
+                  steps=365):
+    # records runs once, then searches tracker positions by replaying detection only; prints the best layout for
+    # each tracker count, the track error / tracker count Pareto front and the current layout's error
+    from placement import record_runs, LayoutEvaluator, pareto_front, default_layout
+
+    terrain = TerrainContext.get(elev_cells, veg_cells, width, height)
+    kwargs = {"N": 25, "width": width, "height": height, "elev": elev_cells, "veg": veg_cells, "terrain": terrain,
+              "tracking_type": tracking_type, "vectorized": True}
+    evaluator = LayoutEvaluator(record_runs(kwargs, range(runs), steps), tracking_type)
+    current = default_layout(tracking_type, terrain.sites)
+    placements, front = pareto_front(evaluator, counts, width, height, initial={len(current): current})
+    print("current layout ({} trackers): {:.2f}".format(len(current), evaluator.track_errors(current)[0]))
+    for placement in placements:
+        print("{} trackers: {:.2f} {}".format(placement.trackers, placement.error, placement.layout))
+    print("Pareto front:", [(placement.trackers, round(placement.error, 2)) for placement in front])
+    return placements, front
+
+
 def viz_run(width, height, elev_cells, veg_cells, tracking_type):
-    grid = CanvasGrid(agent_portrayal, width, height, 1200, 900)
+    from mesa.visualization.modules import ChartModule
+    from mesa.visualization.ModularVisualization import ModularServer
+    from visualization import RasterGrid
+
+    # the terrain goes to the browser once as an image, then only the wolves and trackers that changed
+    grid = RasterGrid(width, height, 1200, 900)
     chart = ChartModule([{"Label": "Pack Health",
                           "Color": "Black"}], canvas_height=200, canvas_width=500,
                         data_collector_name='datacollector')
@@ -111,11 +188,9 @@ if __name__ == "__main__":
     # elevation_file = 'data/400x300ElevASCint16.asc'
     vegetation_file = '200x150Tree.asc'
     elevation_file = '200x150Elev.asc'
-    version = "new"
 
-    # reading and prepping data for vegetation and elevation
-    veg_cells, width, height = readASCII(vegetation_file, version=version)
-    elev_cells, width, height = readASCII(elevation_file, version=version)
+    # reading and prepping data for vegetation and elevation (cached as .npy after the first read)
+    elev_cells, veg_cells, width, height = load_terrain(elevation_file, vegetation_file)
 
     # Select tracking method
     # tracking_type = "satellite"
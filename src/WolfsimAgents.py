@@ -5,14 +5,17 @@ Definition of and the functions for the Wolfsim Agents: Wolves, etc.
 from mesa import Agent
 from numpy import random
 import numpy as np
-from utils import weibull_distribution, find_toward
+from utils import find_toward
+from detection import tracker_schedule, TRACKER_TIMER, TRACKER_RANGES
+from metrics import clock
 
 
 class WolfAgent(Agent):
     """An agent of a single wolf."""
 
-    def __init__(self, unique_id, age, collar_type, model):
+    def __init__(self, unique_id, age, collar_type, model, pack_id=0):
         super().__init__(unique_id, model)
+        self.pack_id = pack_id
         self.alive = True
         self.age = age
         self.pos = None
@@ -22,32 +25,24 @@ class WolfAgent(Agent):
         self.tracked_pos = None
         self.type = 4
 
-        self.collar1_dist = weibull_distribution(1, 0.8)
-        self.collar2_dist = weibull_distribution(1, 1)
-
     def move(self):
         if self.pos is None:
             return
+        metrics = self.model.metrics
+        start = clock() if metrics is not None else 0
         step_options = self.model.grid.get_neighborhood(
             self.pos,
             moore=True,
             include_center=True)
-        site_options = self.model.get_sites()
-        target_ind = self.model.target
-        # current_target = site_options[target_ind]
-        current_target = self.model.path[0]
+        pack = self.model.packs[self.pack_id]
+        current_target = pack.path[0]
 
-        new_position = self.move_decision(step_options, current_target, self.model.avg_pos,
-                                          self.model.grid_elevation)  # TODO: change last value to pack avergage pos
+        new_position = self.move_decision(step_options, current_target, pack.avg_pos,
+                                          self.model.grid_elevation)
         # new_position = self.random.choice(step_options)
         self.model.grid.move_agent(self, new_position)
-
-    def attack(self):
-        neighbors = self.model.grid.get_cell_list_contents([self.pos])
-        if len(neighbors) > 1:
-            other = self.random.choice(neighbors)
-            if random.randint(1, 5000) < 2:
-                other.alive = False
+        if metrics is not None:
+            metrics.lap("move", start)
 
     def step(self, debug=False):
         # Chance that wolf is lost to health problems
@@ -56,20 +51,18 @@ class WolfAgent(Agent):
             # self.pos = None
         if not self.alive:
             return
-        # Chance that wolf attacks nearby wolves after age reaches greater than 5 (territorial)
-        if self.age > 5:
-            self.attack()
+        # territorial attacks are resolved for all wolves at once before the agents step, see conflict.py
         if debug:
             print("Agent " + str(self.unique_id) + " with age " + str(self.age) + " is moving from position " + str(
                 self.pos))
         # Increase age by 1 day
         self.age += 1 / 365
-        if self.collar_health > 1:  # failure at 1%
-            # collar wear and tear
-            if self.collar_type == 1:  # radio collar
-                self.collar_health = self.collar1_dist.weib(self.model.time / (365)) * 100
-            elif self.collar_type == 2:
-                self.collar_health = self.collar2_dist.weib(self.model.time / (365)) * 100
+        collars = self.model.collars
+        if self.collar_health > collars.failure:  # failure at 1%
+            # collar wear and tear, looked up in the model's per-type table
+            health = collars.health(self.collar_type, self.model.time)
+            if health is not None:
+                self.collar_health = health
         else:
             self.collar_type = 0
         # Move agent
@@ -89,10 +82,48 @@ class WolfAgent(Agent):
         return new_position
 
 
+def _pack_field(name):
+    def get(self):
+        return getattr(self.pack, name)[self.index].item()
+
+    def set(self, value):
+        getattr(self.pack, name)[self.index] = value
+    return property(get, set)
+
+
+class PackWolfAgent(Agent):
+    """A wolf whose state lives in a row of the model's WolfPack arrays; the pack steps all wolves at once."""
+    type = 4
+
+    def __init__(self, unique_id, index, pack, model):
+        self.index = index
+        self.pack = pack
+        super().__init__(unique_id, model)
+
+    pack_id = _pack_field("pack_id")
+    alive = _pack_field("alive")
+    age = _pack_field("age")
+    collar_type = _pack_field("collar_type")
+    collar_health = _pack_field("collar_health")
+    detected = _pack_field("detected")
+
+    @property
+    def pos(self):
+        return tuple(self.pack.pos[self.index].tolist())
+
+    @pos.setter
+    def pos(self, value):
+        if value is not None:  # the wolf has no "off grid" state
+            self.pack.pos[self.index] = value
+
+    def step(self, debug=False):
+        pass
+
+
 class DetectAgent(Agent):
     """An agent of detection."""
 
-    def __init__(self, unique_id, tracking_type, pos, model):
+    def __init__(self, unique_id, tracking_type, pos, model, dist=None, timer=None):
         super().__init__(unique_id, model)
         self.active = False
         self.alive = False
@@ -101,66 +132,14 @@ class DetectAgent(Agent):
         self.pos = pos
         self.type = 5
         self.tracking_type = tracking_type
-        if self.tracking_type == "satellite":
-            self.timer = 5
-            self.dist = 1000
-        if self.tracking_type == "stations":
-            self.timer = 5
-            self.dist = 100
-        if self.tracking_type == "helicopters":
-            self.timer = 5
-            self.dist = 75
-        if self.tracking_type == "planes":
-            self.timer = 5
-            self.dist = 100
+        self.timer = TRACKER_TIMER if timer is None else timer
+        self.dist = TRACKER_RANGES[tracking_type] if dist is None else dist
 
     def step(self, debug=False):
-        if self.model.time % (self.timer) == 0 and not (
-                self.tracking_type == "helicopters" or self.tracking_type == "planes"):
+        active, scans = tracker_schedule(self.tracking_type, self.model.time, self.timer,
+                                         self.unique_id - self.model.num_agents)
+        if active:
             self.active = True
-            self.detect_nearby()
-        elif self.model.time % (self.timer) == 0 and self.tracking_type == "helicopters":
-            if self.model.time / (self.timer) % 4 == 1:
-                if self.unique_id - self.model.num_agents < 2:
-                    self.active = True
-                    self.detect_nearby()
-            if self.model.time / (self.timer) % 4 == 2:
-                if self.unique_id - self.model.num_agents < 4 and self.unique_id - self.model.num_agents > 1:
-                    self.active = True
-                    self.detect_nearby()
-            if self.model.time / (self.timer) % 4 == 3:
-                if self.unique_id - self.model.num_agents < 6 and self.unique_id - self.model.num_agents > 3:
-                    self.active = True
-                    self.detect_nearby()
-            if self.model.time / (self.timer) % 4 == 0:
-                if self.unique_id - self.model.num_agents < 8 and self.unique_id - self.model.num_agents > 5:
-                    self.active = True
-        elif self.model.time % (self.timer) == 0 and self.tracking_type == "planes":
-            if self.model.time / (self.timer) % 3 == 1:
-                if (self.unique_id - self.model.num_agents < 3 and self.unique_id - self.model.num_agents > 0) \
-                        or self.unique_id - self.model.num_agents == 0:
-                    self.active = True
-                    self.detect_nearby()
-            if self.model.time / (self.timer) % 3 == 2:
-                if (self.unique_id - self.model.num_agents < 5 and self.unique_id - self.model.num_agents > 2) \
-                        or self.unique_id - self.model.num_agents == 0:
-                    self.active = True
-                    self.detect_nearby()
-            if self.model.time / (self.timer) % 3 == 0:
-                if (self.unique_id - self.model.num_agents < 7 and self.unique_id - self.model.num_agents > 4) \
-                        or self.unique_id - self.model.num_agents == 0:
-                    self.active = True
-                    self.detect_nearby()
-
-    def detect_nearby(self):
-        for wolf in self.model.schedule.agents:
-            if wolf.alive == True and (wolf.collar_type == 1 or wolf.collar_type == 2):
-                if np.linalg.norm(np.array(wolf.pos) - np.array(self.pos)) < self.dist:
-                    if self.tracking_type == "satellite":
-                        if 25 > random.randint(0, 100):
-                            wolf.detected = True
-                    else:
-                        if (self.dist - (
-                        np.linalg.norm(np.array(wolf.pos) - np.array(self.pos))) / self.dist * 100) > random.randint(0,
-                                                                                                                     100):
-                            wolf.detected = True
+        if scans:
+            # the model runs the detection pass of all scanning trackers together once they have stepped
+            self.model.scanning.append(self)
@@ -8,105 +8,73 @@ Wolfsim Model defines the agent-based simulation components such as the creation
 from mesa import Model
 from mesa.time import RandomActivation
 from numpy import random
+from random import Random
 from mesa.space import MultiGrid
-from mesa.datacollection import DataCollector
 import numpy as np
-import matplotlib.pyplot as plt
-import networkx as nx
 
-from WolfsimAgents import WolfAgent, DetectAgent
-from environment import *
-from utils import *
-
-# Plotting preparation
-fig, ax = plt.subplots()
+from WolfsimAgents import WolfAgent, DetectAgent, PackWolfAgent
+from pack import WolfPack, Pack
+from detection import detect_wolves, tracker_positions
+from conflict import resolve_attacks
+from collars import CollarModel
+from environment import Vegetation, Elevation_Out_of_Bound
+from utils import compute_pack_position, compute_est_pack_position, compute_updated_target_pathing, wolf_positions, \
+    compute_pack_tracking, mean_pack_error, feeding_site_candidates
+from terrain import TerrainContext
+from collector import ColumnarCollector
+from events import EventBus
+from occupancy import ArrayGrid
+from metrics import StepMetrics, clock
 
 # Wolf simulation model class
 class WolfModel(Model):
     """A model with some number of wolves."""
     # def __init__(self, N, width, height, plot_movement = False,tracking_type, n_collars):
-    def __init__(self, N, width, height, elev, veg, tracking_type="planes", n_collars=1, plot_movement=False):
-        super().__init__()
+    def __init__(self, N, width, height, elev, veg, tracking_type="planes", n_collars=1, plot_movement=False,
+                 terrain=None, vectorized=False, n_packs=1, seed=None, sample_interval=1,
+                 metrics=False, space="array", collars=None, tracker_dist=None, tracker_timer=None,
+                 tracker_layout=None):
+        super().__init__()  # Mesa seeds self.random from the seed keyword
         self.num_agents = N
         self.width = width
         self.height = height
-        self.grid = MultiGrid(width, height, True)
-        self.grid_elevation = np.zeros((width, height))
+        # "array" keeps terrain in arrays and only the occupied cells (see occupancy.py), "multigrid" is Mesa's grid
+        self.grid = ArrayGrid(width, height, True) if space == "array" else MultiGrid(width, height, True)
         self.schedule = RandomActivation(self)
         self.running = True
         self.time = 0
         self.sites = None
         self.avg_pos = np.array([0,0])
-        self.target = 0
         self.plot_movement = plot_movement
-        self.feeding = 0
-        self.path = []
+        self.packs = []  # per-pack target, path, centroid and feeding counter; target/path/feeding are pack 0's
         self.tracked_position = None
         self.tracking_type=tracking_type
+        self.track_error = 0.0
         self.track_error_sum = 0
+        self.pack = None  # WolfPack holding the wolves' state when vectorized
+        self.trackers = []
+        self.scanning = []  # trackers scanning for wolves this step
+        self.events = EventBus()  # path/positions/detection events for rendering and other observers
+        self.metrics = StepMetrics() if metrics else None  # per-phase step timings, see metrics.py
+        self.collars = CollarModel() if collars is None else collars  # per-type collar health table, see collars.py
+
+        # Terrain layers, feeding sites and the path planner are shared read-only between models
+        if terrain is None:
+            terrain = TerrainContext.get(elev, veg, width, height)
+        self.attach_terrain(terrain)
 
-        empty_masterdict = {'Outside_FNNR': [], 'Elevation_Out_of_Bound': [], 'Vegetation': []}
-
-        # TODO: modify to only do this on the first run when running batch cases
-        # if OLD:
-        #     tree = self.readASCII_OLD(vegetation_file_OLD)[0]  # list of all coordinate values; see readASCII function
-        #     elev = self.readASCII_OLD(elevation_file_OLD)[0]  # list of all elevation values
-        # else:
-        #     tree = self.readASCII(vegetation_file)[0]  # list of all coordinate values; see readASCII function
-        #     elev = self.readASCII(elevation_file)[0]  # list of all elevation values
-        self.elevation_fill(elev)
-
-        for x in [Elevation_Out_of_Bound]: #TODO: we need to use this info to restrict movement through "obstacles"
-            self.populate(empty_masterdict, elev, x, width, height)
-        for x in [Vegetation, Outside_FNNR]:
-            self.populate(empty_masterdict, veg, x, width, height)
-        # adding image agent in
-        # img_agent = Img(0, self)
-        # self.grid.place_agent(img_agent, (0,0))
-
-        # graph structure for path planning
-        # tree = np.array(veg).astype(np.int).transpose()
-        tree = np.zeros((height, width))
-        for i in range(len(veg)):
-            for j in range(len(veg[0])):
-                tree[i,j] = int(veg[i][j])
-        tree = tree.transpose()
-        self.tree = tree.copy()
-
-
-        # self.tree = tree.copy()
-        elevation = self.grid_elevation.copy()
-        # elevation = elevation.transpose()
-
-        self.G = nx.generators.lattice.grid_2d_graph(self.width, self.height, periodic=False)
-        tree_value = 1 * 10
-        elev_value = 0.1 * 30
-        for e in self.G.edges():
-            # print(Tree[e[0]])
-            if elevation[e[0]] + elevation[e[1]] < 2 or tree[e[0]] + tree[e[1]] > 0 :
-                self.G[e[0]][e[1]]['weight'] = 99999999
-            else:
-
-                self.G[e[0]][e[1]]['weight'] = tree_value * (abs(tree[e[0]] + tree[e[1]] - 4)) + elev_value * (
-                        abs((elevation[e[0]] - elevation[e[1]])) / 2)
-
-        masterdict = empty_masterdict
-
-        startinglist = masterdict['Vegetation']
-        # Agents will start out in high-probability areas.
-        for coordinate in masterdict['Elevation_Out_of_Bound']:
-                if coordinate in startinglist:
-                    startinglist.remove(coordinate)
-
-        # self.sites = startinglist  # the target locations are formed from the startinglist above
-        num_sites = 8  # limiting feeding sites to 8 locations evelty spaced across grid
-        site_indices = np.linspace(0,len(startinglist)-1, num_sites)
-        self.sites = [startinglist[int(ind)] for ind in site_indices]
-        self.target = self.random.randint(0,num_sites-1) # update
-        # the initial target to a random location
-        # self.target=0
-        self.path = [self.sites[self.target]]  # initialize the wolf path to a list of only the intial location
-        # self.target, self.path = compute_updated_target_pathing(self, plot=False)
+        # Only out-of-bound elevation cells are drawn, so they are the only land agents placed on the grid
+        # TODO: we need to use this info to restrict movement through "obstacles"
+        self.populate(terrain.out_of_bound_cells, Elevation_Out_of_Bound)
+
+        self.sites = list(terrain.sites)
+        num_sites = len(self.sites)
+        # the initial target of each pack is a random feeding site, distinct while there are free sites, drawn from
+        # the sites choose_feeding_site retargets packs to
+        for p in range(n_packs):
+            candidates = feeding_site_candidates(num_sites, [pack.target for pack in self.packs])
+            target = candidates[self.random.randrange(len(candidates))]
+            self.packs.append(Pack(p, target, self.sites))
         self.tracked_position = self.sites[self.target]
 
         for p in range(0,len(self.sites)):
@@ -115,7 +83,8 @@ class WolfModel(Model):
 
         plot_sites = False
         if plot_sites:
-            plot_feeding_zones(self, startinglist)
+            from plotting import plot_feeding_zones
+            plot_feeding_zones(self, zip(*terrain.starting_cells))
 
         # Detection Method input for collar type
         if tracking_type=="satellite":
@@ -123,50 +92,92 @@ class WolfModel(Model):
         else:
             c_type=1
 
-        # Create agents
-        for i in range(self.num_agents):
+        # Create agents, split into n_packs contiguous packs each with n_collars collared wolves
+        pack_ids = np.arange(self.num_agents) * n_packs // max(self.num_agents, 1)
+        rank_in_pack = np.arange(self.num_agents) - np.searchsorted(pack_ids, pack_ids)
+        collars = np.where(rank_in_pack < n_collars, c_type, 0).tolist()
+        pack_ids = pack_ids.tolist()
+        starts = [self.sites[self.packs[p].target] for p in pack_ids]
+        if vectorized:
+            # the pack steps every wolf in one batched update; the scheduled agents are views onto its arrays
+            ages = random.randint(1, 5, self.num_agents)
+            self.pack = WolfPack(self, ages, collars, starts, pack_ids=pack_ids, seed=self.random.randrange(2 ** 32))
+            for i in range(self.num_agents):
+                wolf = PackWolfAgent(i, i, self.pack, self)
+                self.pack.agents.append(wolf)
+                self.schedule.add(wolf)
+        for i in range(self.num_agents if self.pack is None else 0):
             age = random.randint(1,5)
-            if i < n_collars:
-                collar = c_type
-            else:
-                collar = 0
-            wolf = WolfAgent(i, age, collar, self)
+            wolf = WolfAgent(i, age, collars[i], self, pack_id=pack_ids[i])
             self.schedule.add(wolf)
             # add agents to grid
-            start = self.sites[self.target]
             # start = tuple(start + random.randint(0,5,2)) # randomly push around target location
-            self.grid.place_agent(wolf, start)
+            self.grid.place_agent(wolf, starts[i])
 
         # Create Trackers
-        if self.tracking_type=="satellite":
-            sat_pos = (100,100)
-            tracker = DetectAgent(i+self.num_agents, "satellite", sat_pos, self)
+        # range, days between scans and positions default to those of the tracking type (see detection.py)
+        if tracker_layout is None:
+            tracker_layout = tracker_positions(self.tracking_type, self.sites)
+        for index, pos in enumerate(tracker_layout):
+            # trackers are numbered from num_agents, right after the wolves
+            tracker = DetectAgent(self.num_agents + index, self.tracking_type, tuple(pos), self, dist=tracker_dist,
+                                  timer=tracker_timer)
             self.schedule.add(tracker)
+            self.trackers.append(tracker)
             self.grid.place_agent(tracker, tracker.pos)
-        if self.tracking_type=="stations":
-            stat_pos = [(60,100), (160,100)]
-            for i in range(len(stat_pos)):
-                tracker = DetectAgent(i+self.num_agents, self.tracking_type, stat_pos[i], self)
-                self.schedule.add(tracker)
-                self.grid.place_agent(tracker, tracker.pos)
-        if self.tracking_type=="helicopters":
-            stat_pos = self.sites
-            for i in range(len(stat_pos)):
-                tracker = DetectAgent(i+self.num_agents, self.tracking_type, stat_pos[i], self)
-                self.schedule.add(tracker)
-                self.grid.place_agent(tracker, tracker.pos)
-        if self.tracking_type == "planes":
-            stat_pos = [(100, 50),(0, 100), (50,75),(116,100),(133,149),(150,35),(199,20)]
-            for i in range(len(stat_pos)):
-                tracker = DetectAgent(i + self.num_agents, self.tracking_type, stat_pos[i], self)
-                self.schedule.add(tracker)
-                self.grid.place_agent(tracker, tracker.pos)
-
-        self.datacollector = DataCollector(
-        agent_reporters={"Alive": "alive","Age": "age", "Pos": "pos"},
-        model_reporters={"Pack Health": compute_pack_health ,"Pack Position": compute_pack_position, "Pack Estimated Position": compute_est_pack_position,
-                             "Pack Track Error": compute_track_error, "Pack Average Track Error":compute_track_error_average}
-        )
+
+        # wolves' Alive/Age/Pos every sample_interval days and the pack statistics every day, in numpy columns
+        self.datacollector = ColumnarCollector(self, agent_interval=sample_interval)
+
+        if self.plot_movement:
+            # position maps every 25 days, rendered off the simulation's process
+            from plotting import FrameExporter
+            self.frame_exporter = FrameExporter(every=25).attach(self)
+
+    def attach_terrain(self, terrain):
+        self.terrain = terrain
+        self.grid_elevation = terrain.elevation
+        self.tree = terrain.tree
+        self.pathfinder = terrain.pathfinder
+        self.routes = terrain.routes
+
+    def __getstate__(self):
+        # the terrain is shared and rebuilt elsewhere; Mesa keeps the model's random generator on the class
+        state = self.__dict__.copy()
+        for name in ("terrain", "grid_elevation", "tree", "pathfinder", "routes", "frame_exporter"):
+            state.pop(name, None)
+        state["_random_state"] = self.random.getstate()
+        return state
+
+    def __setstate__(self, state):
+        random_state = state.pop("_random_state")
+        self.__dict__.update(state)
+        self.random = Random()
+        self.random.setstate(random_state)
+
+    @property
+    def target(self):
+        return self.packs[0].target
+
+    @target.setter
+    def target(self, value):
+        self.packs[0].target = value
+
+    @property
+    def path(self):
+        return self.packs[0].path
+
+    @path.setter
+    def path(self, value):
+        self.packs[0].path = value
+
+    @property
+    def feeding(self):
+        return self.packs[0].feeding
+
+    @feeding.setter
+    def feeding(self, value):
+        self.packs[0].feeding = value
 
     def get_sites(self):
         if self.sites is not None:
@@ -177,59 +188,76 @@ class WolfModel(Model):
     def step(self):
         '''Advance the model by one step.'''
         self.time += 1 # day metric
+        metrics = self.metrics
+        lap = clock() if metrics is not None else 0
+        # pack statistics are computed once here and read by the collector
+        if len(self.packs) > 1:
+            # each pack is tracked on its own; the model reports pack 0's position and the mean of the packs' errors
+            positions, estimates, errors = compute_pack_tracking(self)
+            self.avg_pos, self.tracked_position = positions[0], estimates[0]
+            self.track_error = mean_pack_error(errors)
+        else:
+            self.avg_pos = compute_pack_position(self)
+            self.tracked_position = compute_est_pack_position(self)
+            self.track_error = np.linalg.norm(np.array(self.avg_pos) - np.array(self.tracked_position))
+        self.track_error_sum += self.track_error
+        if metrics is not None:
+            lap = metrics.lap("statistics", lap)
         self.datacollector.collect(self)
-        self.avg_pos = compute_pack_position(self)
-        self.tracked_position = compute_est_pack_position(self)
+        if metrics is not None:
+            lap = metrics.lap("collect", lap)
         # self.target = compute_updated_target(self)
-        self.target, self.path = compute_updated_target_pathing(self, plot=True)
-        if self.plot_movement and self.time % 25 == 0:
-            plot_agent_positions(self, fig, ax)
-        for wolfv in self.schedule.agents:
-            if wolfv.type==4:
-                wolfv.detected=False
-            if wolfv.type==5:
-                wolfv.active=False
+        # moves every pack along its path and plans the routes of packs that are done feeding in one batch
+        compute_updated_target_pathing(self)
+        if metrics is not None:
+            lap = metrics.lap("retarget", lap)
+        if self.pack is not None:
+            # only the trackers need resetting one by one, the pack's flags are cleared at once
+            self.pack.detected[:] = False
+            for tracker in self.trackers:
+                tracker.active = False
+        else:
+            for wolfv in self.schedule.agents:
+                if wolfv.type==4:
+                    wolfv.detected=False
+                if wolfv.type==5:
+                    wolfv.active=False
+        if metrics is not None:
+            lap = metrics.lap("reset", lap)
+        # territorial attacks between wolves sharing a cell, for all wolves in one batch
+        resolve_attacks(self)
+        if metrics is not None:
+            lap = metrics.lap("conflict", lap)
+        if self.pack is not None:
+            self.pack.step()
+            if metrics is not None:
+                lap = metrics.lap("pack", lap)
+        self.scanning = []
         self.schedule.step()
+        if metrics is not None:
+            lap = metrics.lap("schedule", lap)
+        detect_wolves(self, self.scanning)
+        if metrics is not None:
+            lap = metrics.lap("detection", lap)
+        self._emit_step_events()
+        if metrics is not None:
+            metrics.lap("events", lap)
 
-    def elevation_fill(self, grid):
-        for y in range(self.height):  # for each pixel,
-            for x in range(1,self.width):
-                value = float(grid[y][x])  # val
-                self.grid_elevation[x][y] = value
-
-        plot=False
-        if plot:
-            # np.save("elevation_image.)
-            plt.imshow(self.grid_elevation)
-            plt.clim(0, self.grid_elevation.max())
-            plt.colorbar()
-            plt.title("Elevation Map")
-            plt.show()
-
-    def populate(self, masterdict, grid, land_type, width, height):
-        counter = 0  # sets agent ID - not currently used
-        for y in range(height):  # for each pixel,
-            for x in range(1,width):
-                value = float(grid[y][x])  # value from the ASCII file for that coordinate/pixel, e.g. 1550 elevation
-                land_grid_coordinate = x, y
-                land = land_type(counter, self)
-                if land_type.__name__ == 'Elevation_Out_of_Bound':
-                    if (value < land_type.lower_bound or value > land_type.upper_bound) and value != -9999:
-                        # if elevation is not bounds but is within the bounds of the FNNR, mark as 'elevation OOB'
-                        land.elevation = value
-                        self.grid.place_agent(land, land_grid_coordinate)
-                        masterdict[land.__class__.__name__].append(land_grid_coordinate)
-                        counter += 1
-                elif land_type.__name__ == 'Vegetation':
-                    if land_type.type == value:
-                        land.elevation = value
-                        # self.grid.place_agent(land, land_grid_coordinate)
-                        masterdict[land.__class__.__name__].append(land_grid_coordinate)
-                        counter += 1
-                else:  # elevation background
-                # if land_type.type == value:
-                    land.elevation = value
-                    # self.grid.place_agent(land, land_grid_coordinate)
-                    masterdict[land.__class__.__name__].append(land_grid_coordinate)
-                    counter += 1
+    def _emit_step_events(self):
+        if self.events.wants("positions"):
+            wolves = self.datacollector.sample_wolves(self)
+            self.events.emit("positions", model=self, time=self.time, positions=wolves["Pos"],
+                             alive=wolves["Alive"])
+        if self.events.wants("detection"):
+            self.events.emit("detection", model=self, time=self.time, trackers=list(self.scanning),
+                             detected=wolf_positions(self, detected=True))
 
+    def populate(self, cells, land_type):
+        # places one land agent per (x, y, value) cell, numbered row by row; an ArrayGrid only records the cells
+        if isinstance(self.grid, ArrayGrid):
+            self.grid.set_land(cells, land_type)
+            return
+        xs, ys, values = cells
+        for counter, (x, y, value) in enumerate(zip(xs.tolist(), ys.tolist(), values.tolist())):
+            land = land_type(counter, self, elevation=value)
+            self.grid.place_agent(land, (x, y))
@@ -0,0 +1,192 @@
+"""
+Adaptive batch sweeps of the Wolfsim model
+
+Instead of a fixed number of iterations per parameter point, AdaptiveBatchRunner keeps a running mean and variance
+(Welford) of each model reporter per point and schedules runs in rounds. A point is done once it has min_iterations
+runs and the confidence interval of every targeted reporter is within its precision target; each round's runs go to
+the points whose intervals are furthest from their targets, in proportion to the runs they are estimated to still
+need, until they converge, reach max_iterations or the budget is spent. Runs keep the seeds and records of
+ParallelBatchRunner, so the store, sinks and ensemble mode work as for a fixed sweep, and
+get_convergence_dataframe reports how many runs each point took.
+"""
+
+import math
+import os
+from collections import OrderedDict
+
+from batchrun import ParallelBatchRunner, run_seed
+from checkpoint import run_key
+
+
+class RunningStats():
+    """Count, mean and sum of squared deviations of a series of values (Welford's algorithm)."""
+    __slots__ = ("count", "mean", "m2")
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    @property
+    def variance(self):
+        return self.m2 / (self.count - 1) if self.count > 1 else math.inf
+
+    def half_width(self, confidence=0.95):
+        """Half width of the Student t confidence interval of the mean."""
+        if self.count < 2:
+            return math.inf
+        from scipy.stats import t
+
+        return t.ppf((1 + confidence) / 2, self.count - 1) * math.sqrt(self.variance / self.count)
+
+
+class AdaptiveBatchRunner(ParallelBatchRunner):
+    """
+    Sweep every parameter point (see ParallelBatchRunner) until the targeted reporters are known precisely enough.
+
+    targets maps reporter names to the largest acceptable confidence interval half width of their mean, e.g.
+    {"track_error": 0.5, "pack_health": 0.01}; reporters without a target are tracked but do not hold a point back.
+    Every point gets at least min_iterations and at most max_iterations runs, and budget (None for no limit) caps the
+    total number of runs. round_size runs are scheduled per round (four per process by default). The other
+    parameters are those of ParallelBatchRunner; iterations is not used.
+    """
+
+    def __init__(self, model_cls, variable_parameters=None, fixed_parameters=None, targets=None, confidence=0.95,
+                 min_iterations=5, max_iterations=100, budget=None, round_size=None, **kwargs):
+        super().__init__(model_cls, variable_parameters, fixed_parameters, iterations=max_iterations, **kwargs)
+        self.targets = dict(targets or {})
+        unknown = set(self.targets) - set(self.model_reporters)
+        if unknown:
+            raise ValueError("precision targets for unknown reporters: {}".format(sorted(unknown)))
+        self.confidence = confidence
+        self.min_iterations = min_iterations
+        self.max_iterations = max_iterations
+        self.budget = budget
+        self.round_size = round_size or 4 * (self.processes or os.cpu_count() or 1)
+        self.point_params = OrderedDict((self.point(params), params) for params in self.parameter_points())
+        self.stats = {point: {name: RunningStats() for name in self.model_reporters} for point in self.point_params}
+        self.runs = {point: 0 for point in self.point_params}
+        self.next_iteration = {point: 0 for point in self.point_params}
+        self.next_run = 0
+        for record in self.store.load() if self.store is not None else []:
+            self.observe(record)
+
+    def point(self, params):
+        # parameter values may be lists (tracker layouts), so points are keyed by their JSON
+        return run_key({name: params[name] for name in self.variable_parameters}, None)
+
+    def observe(self, record):
+        point = self.point(record)
+        if point not in self.point_params:
+            return
+        self.runs[point] += 1
+        self.next_iteration[point] = max(self.next_iteration[point], record["Iteration"] + 1)
+        self.next_run = max(self.next_run, record["Run"] + 1)
+        for name, stats in self.stats[point].items():
+            value = record.get(name)
+            # runs where a reporter is undefined (no wolf left) do not count towards its interval
+            if value is not None and math.isfinite(value):
+                stats.add(value)
+
+    def record(self, run, params, iteration, seed, results):
+        record = super().record(run, params, iteration, seed, results)
+        self.observe(record)
+        return record
+
+    def shortfall(self, point):
+        """Largest ratio of a targeted reporter's interval half width to its target (<= 1 once precise enough)."""
+        ratio = 0.0
+        for name, target in self.targets.items():
+            half_width = self.stats[point][name].half_width(self.confidence)
+            ratio = max(ratio, half_width / target if target > 0 else (0.0 if half_width == 0 else math.inf))
+        return ratio
+
+    def converged(self, point):
+        return self.runs[point] >= self.min_iterations and self.shortfall(point) <= 1
+
+    def remaining(self):
+        return math.inf if self.budget is None else self.budget - sum(self.runs.values())
+
+    def needed(self, point):
+        """Estimated further runs for point to meet its targets, as the interval narrows with 1/sqrt(runs)."""
+        runs = self.runs[point]
+        if runs < self.min_iterations:
+            return self.min_iterations - runs
+        shortfall = self.shortfall(point)
+        if math.isinf(shortfall):
+            return self.max_iterations - runs
+        return max(1, math.ceil(runs * shortfall ** 2) - runs)
+
+    def allocate(self):
+        """Runs per point for the next round, largest shortfall first; empty once the sweep is done."""
+        open_points = [point for point in self.point_params
+                       if not self.converged(point) and self.runs[point] < self.max_iterations]
+        capacity = min(self.round_size, self.remaining())
+        if not open_points or capacity <= 0:
+            return {}
+        needs = {point: min(self.needed(point), self.max_iterations - self.runs[point]) for point in open_points}
+        # points still short of min_iterations are topped up first, the rest share the round by their needs
+        allocation = {point: need for point, need in needs.items() if self.runs[point] < self.min_iterations}
+        total = sum(needs[point] for point in open_points if point not in allocation)
+        share = max(capacity - sum(allocation.values()), 0)
+        for point in open_points:
+            if point not in allocation:
+                # never past max_iterations: what a point cannot take is left to the others
+                allocation[point] = min(needs[point], max(1, int(share * needs[point] / total)) if total else 1)
+        order = sorted(open_points, key=self.shortfall, reverse=True)
+        rounded = {}
+        for point in order:
+            runs = min(allocation[point], capacity)
+            if runs > 0:
+                rounded[point] = runs
+                capacity -= runs
+        # capacity left by rounding down goes to the points still short of their needs
+        for point in order:
+            runs = min(needs[point] - rounded.get(point, 0), capacity)
+            if runs > 0:
+                rounded[point] = rounded.get(point, 0) + runs
+                capacity -= runs
+        return rounded
+
+    def round_jobs(self, allocation):
+        jobs = []
+        for point, runs in allocation.items():
+            params = self.point_params[point]
+            for _ in range(runs):
+                iteration = self.next_iteration[point]
+                self.next_iteration[point] += 1
+                jobs.append((self.next_run, params, iteration, run_seed(params, iteration, self.seed)))
+                self.next_run += 1
+        return jobs
+
+    def iter_rounds(self):
+        """Run round after round, yielding the records of each round, until every point is done."""
+        while True:
+            jobs = self.round_jobs(self.allocate())
+            if not jobs:
+                return
+            yield list(self.iter_results(jobs))
+
+    def run_all(self):
+        for _ in self.iter_rounds():
+            pass
+
+    def get_convergence_dataframe(self):
+        """One row per parameter point: its runs, whether it converged, and each reporter's mean and half width."""
+        import pandas as pd
+
+        rows = []
+        for point, params in self.point_params.items():
+            row = dict(params)
+            row.update(Runs=self.runs[point], Converged=self.converged(point))
+            for name, stats in self.stats[point].items():
+                row[name] = stats.mean if stats.count else math.nan
+                row[name + "_ci"] = stats.half_width(self.confidence)
+            rows.append(row)
+        return pd.DataFrame(rows)
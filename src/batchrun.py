@@ -0,0 +1,253 @@
+"""
+Parallel batch runs of the Wolfsim model
+
+ParallelBatchRunner takes the same fixed/variable parameter layout as Mesa's BatchRunner but spreads the runs over a
+process pool. Fixed parameters (terrain included) are handed to each worker once when it starts, every run gets a
+seed derived from its parameters and iteration, and results are yielded as they complete. With a RunStore finished
+runs are saved as they come in and skipped on restart, and long runs can be snapshotted every few steps. A result
+sink streams the run records to Parquet/CSV so the runner need not keep them. With collect_metrics every run is
+timed phase by phase (see metrics.py) and the runner merges the workers' counters. With ensemble=True the iterations
+of each parameter point are run together as one lockstep Ensemble (see ensemble.py) instead of separate models.
+"""
+
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from checkpoint import RunStore, run_key, save_snapshot, load_snapshot
+from metrics import StepMetrics
+
+# Per-process state set by _init_worker, so jobs only carry their variable parameters
+_worker = {}
+
+
+def run_seed(params, iteration, base_seed=0):
+    """Reproducible seed for one run, derived from its variable parameters and iteration number."""
+    key = repr((base_seed, sorted(params.items()), iteration)).encode()
+    return int.from_bytes(hashlib.sha256(key).digest()[:8], "little") >> 1
+
+
+def _init_worker(model_cls, fixed_parameters, model_reporters, max_steps, snapshot_dir, snapshot_every,
+                 collect_metrics):
+    _worker.update(model_cls=model_cls, fixed_parameters=fixed_parameters, model_reporters=model_reporters,
+                   max_steps=max_steps, snapshot_dir=snapshot_dir, snapshot_every=snapshot_every,
+                   collect_metrics=collect_metrics)
+
+
+def run_model(model_cls, kwargs, seed, model_reporters, max_steps, snapshot_path=None, snapshot_every=None,
+              collect_metrics=False):
+    """
+    Build and run one model to completion and return its reporter values. With snapshot_path and snapshot_every
+    the model is saved every snapshot_every steps, and a run that finds a snapshot resumes from it. With
+    collect_metrics the step timings are returned as well, under "Metrics".
+    """
+    if snapshot_path is not None and os.path.exists(snapshot_path):
+        model = load_snapshot(snapshot_path, kwargs.get("terrain"))
+    else:
+        # agents draw from numpy's global generator as well as the model's own
+        np.random.seed(seed % 2 ** 32)
+        model = model_cls(**kwargs, seed=seed)
+    if collect_metrics and getattr(model, "metrics", None) is None:
+        model.metrics = StepMetrics()
+    while model.running and model.schedule.steps < max_steps:
+        model.step()
+        if snapshot_every and snapshot_path is not None and model.schedule.steps % snapshot_every == 0:
+            save_snapshot(model, snapshot_path)
+    results = {name: reporter(model) for name, reporter in model_reporters.items()}
+    if collect_metrics:
+        results["Metrics"] = model.metrics.to_dict()
+    if snapshot_path is not None and os.path.exists(snapshot_path):
+        os.remove(snapshot_path)
+    return results
+
+
+def _run_job(job):
+    run, params, iteration, seed = job
+    kwargs = dict(_worker["fixed_parameters"])
+    kwargs.update(params)
+    snapshot_path = None
+    if _worker["snapshot_dir"] is not None:
+        snapshot_path = os.path.join(_worker["snapshot_dir"], "run-{}.pkl".format(seed))
+    results = run_model(_worker["model_cls"], kwargs, seed, _worker["model_reporters"], _worker["max_steps"],
+                        snapshot_path=snapshot_path, snapshot_every=_worker["snapshot_every"],
+                        collect_metrics=_worker["collect_metrics"])
+    return run, params, iteration, seed, results
+
+
+def _run_ensemble_job(job):
+    runs, params, iterations, seed = job
+    from ensemble import run_ensemble
+
+    kwargs = dict(_worker["fixed_parameters"])
+    kwargs.update(params)
+    results = run_ensemble(kwargs, len(runs), seed, _worker["model_reporters"], _worker["max_steps"])
+    return [(run, params, iteration, seed, result) for run, iteration, result in zip(runs, iterations, results)]
+
+
+def _sink_row(record):
+    # nested values (the step metrics, tracker layouts) are stored as JSON text
+    return {name: [json.dumps(value) if isinstance(value, (dict, list, tuple)) else value]
+            for name, value in record.items()}
+
+
+def parameter_product(variable_parameters):
+    """All combinations of the variable parameters, in the order BatchRunner would run them."""
+    names = list(variable_parameters)
+    for values in itertools.product(*(variable_parameters[name] for name in names)):
+        yield dict(zip(names, values))
+
+
+class ParallelBatchRunner():
+    """
+    Run a model over every combination of variable_parameters, iterations times each, on a pool of processes.
+
+    Variable parameters take precedence over fixed parameters of the same name. If the fixed parameters hold the
+    terrain (elev/veg) but no TerrainContext, one is built here so workers inherit it instead of rebuilding it.
+
+    store is a RunStore (or the path of one): finished runs are appended to it as they complete, and runs it already
+    holds are loaded into the results and not run again. snapshot_dir/snapshot_every save each model in progress
+    every snapshot_every steps so that an interrupted run resumes where it stopped.
+
+    sink is a sinks.ResultSink each run record is written to; with keep_records=False the records are then not kept
+    in memory and get_model_vars_dataframe reads them back from the sink's file.
+
+    collect_metrics adds each run's step timings to its record (a "Metrics" column) and merges them into metrics.
+
+    points is an explicit list of parameter dicts (e.g. a design.py sample) run instead of the combinations of
+    variable_parameters, whose names then default to the points' keys.
+
+    ensemble runs the iterations of each parameter point in lockstep as one Ensemble of replicates, which share a
+    seed (the Seed column) and ignore model_cls; it cannot be combined with snapshots or collect_metrics.
+    """
+
+    def __init__(self, model_cls, variable_parameters=None, fixed_parameters=None, iterations=1, max_steps=1000,
+                 model_reporters=None, processes=None, seed=0, store=None, snapshot_dir=None, snapshot_every=None,
+                 sink=None, keep_records=True, collect_metrics=False, ensemble=False, points=None):
+        if ensemble and (snapshot_dir is not None or collect_metrics):
+            raise ValueError("ensemble runs cannot be snapshotted or timed")
+        self.model_cls = model_cls
+        self.points = None if points is None else [dict(point) for point in points]
+        if variable_parameters is None and self.points:
+            variable_parameters = {name: [point[name] for point in self.points] for name in self.points[0]}
+        self.variable_parameters = dict(variable_parameters or {})
+        self.fixed_parameters = dict(fixed_parameters or {})
+        self.iterations = iterations
+        self.max_steps = max_steps
+        self.model_reporters = dict(model_reporters or {})
+        self.processes = processes
+        self.seed = seed
+        self.store = RunStore(store) if isinstance(store, str) else store
+        self.snapshot_dir = snapshot_dir
+        self.snapshot_every = snapshot_every
+        self.sink = sink
+        self.collect_metrics = collect_metrics
+        self.ensemble = ensemble
+        self.metrics = StepMetrics()  # merged step timings of the runs done by this runner
+        self.keep_records = keep_records or sink is None
+        previous = self.store.load() if self.store is not None else []
+        for record in previous if sink is not None else []:
+            self.sink.write(**_sink_row(record))
+        self.records = previous if self.keep_records else []
+        self._prepare_terrain()
+
+    def _prepare_terrain(self):
+        fixed = self.fixed_parameters
+        if "terrain" not in fixed and all(k in fixed for k in ("elev", "veg", "width", "height")):
+            from terrain import TerrainContext
+            fixed["terrain"] = TerrainContext.get(fixed["elev"], fixed["veg"], fixed["width"], fixed["height"])
+        if "terrain" in fixed:
+            # build the feeding-site routes once, before the workers start
+            fixed["terrain"].routes.precompute()
+
+    def parameter_points(self):
+        """The parameter dicts of the sweep: the given points, or every combination of the variable parameters."""
+        if self.points is not None:
+            return iter(self.points)
+        return parameter_product(self.variable_parameters)
+
+    def jobs(self):
+        """(run, params, iteration, seed) for every run not yet in the store, numbered in BatchRunner order."""
+        done = self.store.completed(self.variable_parameters) if self.store is not None else set()
+        run = itertools.count()
+        for params in self.parameter_points():
+            for iteration in range(self.iterations):
+                number = next(run)
+                if run_key(params, iteration) not in done:
+                    yield number, params, iteration, run_seed(params, iteration, self.seed)
+
+    def ensemble_jobs(self, jobs):
+        """
+        The jobs grouped by parameter point as (runs, params, iterations, seed), one ensemble each, seeded with the
+        seed of its first run.
+        """
+        groups = {}
+        for run, params, iteration, seed in jobs:
+            group = groups.setdefault(run_key(params, None), ([], params, [], seed))
+            group[0].append(run)
+            group[2].append(iteration)
+        return list(groups.values())
+
+    def _executor(self):
+        methods = multiprocessing.get_all_start_methods()
+        # forked workers share the parent's terrain arrays instead of unpickling a copy each
+        context = multiprocessing.get_context("fork" if "fork" in methods else None)
+        return ProcessPoolExecutor(max_workers=self.processes, mp_context=context, initializer=_init_worker,
+                                   initargs=(self.model_cls, self.fixed_parameters, self.model_reporters,
+                                             self.max_steps, self.snapshot_dir, self.snapshot_every,
+                                             self.collect_metrics))
+
+    def submit(self, executor, jobs):
+        if self.ensemble:
+            return [executor.submit(_run_ensemble_job, job) for job in self.ensemble_jobs(jobs)]
+        return [executor.submit(_run_job, job) for job in jobs]
+
+    def record(self, run, params, iteration, seed, results):
+        record = dict(params)
+        record.update(Run=run, Iteration=iteration, Seed=seed)
+        record.update(results)
+        if "Metrics" in results:
+            self.metrics.merge(StepMetrics.from_dict(results["Metrics"]))
+        if self.keep_records:
+            self.records.append(record)
+        if self.sink is not None:
+            self.sink.write(**_sink_row(record))
+        if self.store is not None:
+            self.store.append(record)
+        return record
+
+    def iter_results(self, jobs=None):
+        """Run the jobs (all of them by default) and yield each result record as soon as its run finishes."""
+        jobs = list(self.jobs() if jobs is None else jobs)
+        if not jobs:
+            return
+        with self._executor() as executor:
+            for future in as_completed(self.submit(executor, jobs)):
+                for result in future.result() if self.ensemble else [future.result()]:
+                    yield self.record(*result)
+
+    def run_all(self):
+        for _ in self.iter_results():
+            pass
+
+    def get_model_vars_dataframe(self):
+        """Results collected so far, one row per run ordered by Run, with the variable parameters as columns."""
+        import pandas as pd
+        from sinks import read_results
+
+        columns = list(self.variable_parameters) + ["Run", "Iteration", "Seed"] + list(self.model_reporters)
+        if self.collect_metrics:
+            columns.append("Metrics")
+        if not self.keep_records:
+            # the sink has to be finished before its file can be read back
+            self.sink.close()
+            if not self.sink.rows:
+                return pd.DataFrame(columns=columns)
+            return read_results(self.sink.path, columns).sort_values(by="Run").reset_index(drop=True)
+        if not self.records:
+            return pd.DataFrame(columns=columns)
+        return pd.DataFrame(self.records, columns=columns).sort_values(by="Run").reset_index(drop=True)
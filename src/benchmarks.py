@@ -0,0 +1,371 @@
+"""
+Timing benchmarks for WolfSim
+
+Run from the src directory:
+    python benchmarks.py                      # micro benchmarks (imports, construction, pathfinding, pack step)
+    python benchmarks.py scenarios --json results.json [--profile-dir profiles]
+    python benchmarks.py compare baseline.json results.json
+
+The scenarios benchmark times model construction and, per step, each phase of the step (retarget/pathfinding,
+detection, data collection, agent updates, ...) for every combination of dataset, pack size, tracking type and wolf
+engine, and writes the results as JSON so runs on two commits can be compared.
+"""
+
+import argparse
+import contextlib
+import cProfile
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from terrain import load_terrain
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(SRC_DIR, os.pardir, "data")
+
+TRACKING_TYPES = ("satellite", "planes", "helicopters", "stations")
+PACK_SIZES = (10, 100, 1000, 10000)
+ENGINES = ("agents", "vectorized")
+MAX_AGENT_ENGINE_N = 1000  # the per-agent engine is skipped above this pack size
+
+# Heavy modules that only plotting, visualization, analysis or output should load
+DEFERRED_MODULES = ("matplotlib", "pandas", "networkx", "tornado", "scipy.stats", "scipy.ndimage", "scipy.spatial")
+
+DATASETS = {
+    "200x150": ("200x150Elev.asc", "200x150Tree.asc"),
+    "400x300": ("400x300ElevASCint16.asc", "400x300TreeASCbyte2.asc"),
+    "800x600": ("800x600ElevASCint16.asc", "800x600TreeASCbyte1.asc"),
+}
+
+
+def load_dataset(name):
+    elevation_file, vegetation_file = DATASETS[name]
+    return load_terrain(os.path.join(DATA_DIR, elevation_file), os.path.join(DATA_DIR, vegetation_file))
+
+
+def build_terrain(elev, veg, width, height):
+    """A new TerrainContext with the path planning structures every model attaches built, bypassing the cache."""
+    from terrain import TerrainContext
+
+    terrain = TerrainContext(elev, veg, width, height)
+    terrain.routes  # builds the pathfinder too
+    return terrain
+
+
+def time_call(func, repeats=3):
+    """Best-of-repeats wall time of func() in seconds."""
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def import_profile(module):
+    """
+    Import time of module in a fresh interpreter, from python -X importtime: (seconds, {imported name: cumulative
+    seconds}) for everything it pulled in.
+    """
+    output = subprocess.run([sys.executable, "-X", "importtime", "-c", "import {}".format(module)], cwd=SRC_DIR,
+                            stderr=subprocess.PIPE, universal_newlines=True, check=True).stderr
+    cumulative = {}
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, total, name = line[len("import time:"):].split("|")
+        cumulative[name.strip()] = int(total) / 1e6
+    return cumulative[module], cumulative
+
+
+def loaded_modules(module):
+    """Names of all modules loaded by importing module in a fresh interpreter."""
+    code = "import sys, {}; print('\\n'.join(sys.modules))".format(module)
+    output = subprocess.run([sys.executable, "-c", code], cwd=SRC_DIR, stdout=subprocess.PIPE,
+                            universal_newlines=True, check=True).stdout
+    return set(output.split())
+
+
+def bench_imports(modules=("WolfsimModel", "RunWolfsim"), repeats=3, budget=None, top=5):
+    """
+    Startup cost of the entry modules, as a regression guard: fails if one of them loads a DEFERRED_MODULES
+    package, or (when budget is given) takes longer than budget seconds to import.
+    """
+    results = {}
+    for module in modules:
+        profiles = [import_profile(module) for _ in range(repeats)]
+        seconds, cumulative = min(profiles, key=lambda profile: profile[0])
+        leaked = sorted(name for name in DEFERRED_MODULES if name in loaded_modules(module))
+        heaviest = sorted((name for name in cumulative if name != module and "." not in name),
+                          key=cumulative.get, reverse=True)[:top]
+        results[module] = {"seconds": seconds, "leaked": leaked,
+                           "heaviest": [(name, cumulative[name]) for name in heaviest]}
+        print("{:>14} import: {:8.4f} s  heaviest: {}".format(
+            module, seconds, ", ".join("{} {:.3f}".format(name, cumulative[name]) for name in heaviest)))
+        if leaked:
+            raise AssertionError("importing {} loads {}".format(module, ", ".join(leaked)))
+        if budget is not None and seconds > budget:
+            raise AssertionError("importing {} took {:.3f} s, budget {:.3f} s".format(module, seconds, budget))
+    return results
+
+
+def bench_construction(datasets=tuple(DATASETS), repeats=3, N=25, tracking_type="planes"):
+    """
+    Build time of the terrain layers and path planner (anew every repeat, as the first model on a map pays it) and
+    of a model on terrain that is already built (as every later model of a batch).
+    """
+    from WolfsimModel import WolfModel
+    from terrain import TerrainContext
+
+    results = {}
+    for name in datasets:
+        elev, veg, width, height = load_dataset(name)
+        terrain_time = time_call(lambda: build_terrain(elev, veg, width, height), repeats=repeats)
+        terrain = TerrainContext.get(elev, veg, width, height)
+        model_time = time_call(lambda: WolfModel(N, width, height, elev, veg, tracking_type=tracking_type,
+                                                 terrain=terrain), repeats=repeats)
+        results[name] = {"terrain": terrain_time, "model": model_time}
+        print("{:>8} construction: terrain {:8.3f} s, model {:8.3f} s".format(name, terrain_time, model_time))
+    return results
+
+
+def bench_pathfinding(datasets=tuple(DATASETS), queries=5, seed=0):
+    """
+    Per-query latency of networkx dijkstra_path, the sparse-matrix pathfinder and the feeding-site route cache,
+    checking that the path costs agree.
+    """
+    import networkx as nx
+    from terrain import TerrainContext
+
+    rng = np.random.RandomState(seed)
+    results = {}
+    for name in datasets:
+        elev, veg, width, height = load_dataset(name)
+        terrain = TerrainContext.get(elev, veg, width, height)
+        pathfinder, graph, routes = terrain.pathfinder, terrain.graph, terrain.routes
+        start = time.perf_counter()
+        routes.precompute()
+        precompute_time = time.perf_counter() - start
+        sources = [(int(x), int(y)) for x, y in zip(rng.randint(1, width, queries), rng.randint(0, height, queries))]
+        targets = [terrain.sites[i] for i in rng.randint(0, len(terrain.sites), queries)]
+
+        nx_time = array_time = route_time = 0.0
+        for source, target in zip(sources, targets):
+            start = time.perf_counter()
+            nx_path = nx.dijkstra_path(graph, source=source, target=target, weight='weight')
+            nx_time += time.perf_counter() - start
+            start = time.perf_counter()
+            path = pathfinder.shortest_path(source, target)
+            array_time += time.perf_counter() - start
+            start = time.perf_counter()
+            route = routes.path(source, target)
+            route_time += time.perf_counter() - start
+            nx_cost = nx.path_weight(graph, nx_path, weight='weight')
+            for found in (path, route):
+                if not np.isclose(pathfinder.path_cost(found), nx_cost, rtol=1e-12):
+                    raise AssertionError("{}: path costs differ for {} -> {}".format(name, source, target))
+        results[name] = {"networkx": nx_time / queries, "pathfinder": array_time / queries,
+                         "route_cache": route_time / queries, "route_precompute": precompute_time}
+        print("{:>8} path query: networkx {:8.4f} s, pathfinder {:8.4f} s, route cache {:8.6f} s "
+              "(precompute {:.3f} s)".format(name, results[name]["networkx"], results[name]["pathfinder"],
+                                             results[name]["route_cache"], precompute_time))
+    return results
+
+
+def bench_pack_step(pack_sizes=(25, 1000, 10000), steps=20, dataset="200x150"):
+    """Per-step time of the per-agent and the vectorized (WolfPack) wolf engines."""
+    from WolfsimModel import WolfModel
+
+    elev, veg, width, height = load_dataset(dataset)
+    results = {}
+    for N in pack_sizes:
+        for vectorized in (False, True):
+            if N > 1000 and not vectorized:
+                continue
+            model = WolfModel(N, width, height, elev, veg, vectorized=vectorized)
+            start = time.perf_counter()
+            for _ in range(steps):
+                model.step()
+            key = (N, "vectorized" if vectorized else "agents")
+            results[key] = (time.perf_counter() - start) / steps
+            print("{:>8} N={:<6} {:>10} step: {:8.4f} s".format(dataset, N, key[1], results[key]))
+    return results
+
+
+@contextlib.contextmanager
+def profiling(filename, profiler="cprofile"):
+    """Profile the block into filename (a .prof stats file, or .html for pyinstrument); no-op without filename."""
+    if filename is None:
+        yield
+        return
+    if profiler == "pyinstrument":
+        from pyinstrument import Profiler  # optional dependency
+        profile = Profiler()
+        profile.start()
+        try:
+            yield
+        finally:
+            profile.stop()
+            with open(filename, 'w') as f:
+                f.write(profile.output_html())
+        return
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        profile.dump_stats(filename)
+
+
+def run_scenario(dataset, N, tracking_type, engine, steps=50, seed=0, profile_dir=None, profiler="cprofile",
+                 warmup=1):
+    """
+    Terrain build time, model construction time on that terrain and mean per-step times of one scenario, after
+    warmup untimed steps (which load lazily imported modules). The terrain is built anew for every scenario, so
+    neither time depends on the scenarios run before. The step is split into the phases the model's metrics time
+    (statistics, collect, retarget, reset, pack, schedule, detection, events), with the mean time of a wolf's move
+    and of a tracker's scan, the retarget count and mean route length.
+    """
+    from WolfsimModel import WolfModel
+    from metrics import StepMetrics
+
+    # Loaded here only so that no timed section below pays for the import: otherwise the first scenario's terrain
+    # build (pathfinding, with scipy.sparse) and a detection pass after the warmup (scipy.spatial) would include it.
+    # They stay out of the module level so the compare and micro benchmark commands load neither, as the model does.
+    import pathfinding
+    import scipy.spatial
+
+    elev, veg, width, height = load_dataset(dataset)
+    start = time.perf_counter()
+    terrain = build_terrain(elev, veg, width, height)
+    terrain_build = time.perf_counter() - start
+    np.random.seed(seed)
+    start = time.perf_counter()
+    model = WolfModel(N, width, height, elev, veg, tracking_type=tracking_type, vectorized=engine == "vectorized",
+                      seed=seed, terrain=terrain)
+    construction = time.perf_counter() - start
+    for _ in range(warmup):
+        model.step()
+
+    model.metrics = StepMetrics()
+    profile_file = None
+    if profile_dir is not None:
+        os.makedirs(profile_dir, exist_ok=True)
+        profile_file = os.path.join(profile_dir, "{}_N{}_{}_{}.{}".format(
+            dataset, N, tracking_type, engine, "html" if profiler == "pyinstrument" else "prof"))
+    with profiling(profile_file, profiler):
+        start = time.perf_counter()
+        for _ in range(steps):
+            model.step()
+        total = time.perf_counter() - start
+
+    metrics = model.metrics.to_dict()
+    # moves and scans are timed inside the pack / schedule / detection phases, and reported per call
+    calls = ("move", "detect_nearby")
+    phases = {phase: timer["total"] / 1e9 / steps for phase, timer in metrics["timers"].items() if phase not in calls}
+    per_call = {name: metrics["timers"][name]["mean"] / 1e9 for name in calls if name in metrics["timers"]}
+    return {"dataset": dataset, "N": N, "tracking_type": tracking_type, "engine": engine, "steps": steps,
+            "terrain": terrain_build, "construction": construction, "step": total / steps, "phases": phases,
+            "per_call": per_call,
+            "retargets": metrics["retargets"], "path_length": metrics["path_lengths"]["mean"],
+            "profile": profile_file}
+
+
+def scenario_key(scenario):
+    return "{dataset}/N={N}/{tracking_type}/{engine}".format(**scenario)
+
+
+def bench_scenarios(datasets=tuple(DATASETS), pack_sizes=PACK_SIZES, tracking_types=TRACKING_TYPES,
+                    engines=ENGINES, steps=50, seed=0, profile_dir=None, profiler="cprofile"):
+    """All scenario combinations, as a JSON-serializable dict with the environment they were measured in."""
+    scenarios = []
+    for dataset in datasets:
+        for N in pack_sizes:
+            for tracking_type in tracking_types:
+                for engine in engines:
+                    if engine == "agents" and N > MAX_AGENT_ENGINE_N:
+                        continue
+                    result = run_scenario(dataset, N, tracking_type, engine, steps, seed, profile_dir, profiler)
+                    scenarios.append(result)
+                    print("{:<40} terrain {:8.3f} s  construction {:8.3f} s  step {:8.5f} s  ({})".format(
+                        scenario_key(result), result["terrain"], result["construction"], result["step"],
+                        ", ".join("{} {:.5f}".format(phase, t) for phase, t in result["phases"].items())))
+    return {"environment": environment_info(), "scenarios": scenarios}
+
+
+def environment_info():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=SRC_DIR, stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL, universal_newlines=True).stdout.strip()
+    except OSError:
+        commit = ""
+    return {"commit": commit, "python": platform.python_version(), "numpy": np.__version__,
+            "machine": platform.machine(), "time": time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+
+def load_results(filename):
+    with open(filename) as f:
+        return json.load(f)
+
+
+def compare_results(baseline, current):
+    """
+    Per-scenario ratio current/baseline of terrain build, construction and step time, for scenarios present in both
+    (results from before terrain builds were timed have no terrain ratio).
+    """
+    before = {scenario_key(s): s for s in baseline["scenarios"]}
+    ratios = {}
+    for scenario in current["scenarios"]:
+        key = scenario_key(scenario)
+        if key not in before:
+            continue
+        measures = [measure for measure in ("terrain", "construction", "step") if measure in before[key]]
+        ratios[key] = {measure: scenario[measure] / before[key][measure] for measure in measures}
+        print("{:<40} {}".format(key, "  ".join("{} x{:6.2f}".format(measure, ratio)
+                                                for measure, ratio in ratios[key].items())))
+    return ratios
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", nargs="?", default="micro", choices=("micro", "scenarios", "compare"))
+    parser.add_argument("files", nargs="*", help="baseline and current JSON files for compare")
+    parser.add_argument("--datasets", nargs="+", default=list(DATASETS), choices=list(DATASETS))
+    parser.add_argument("--sizes", nargs="+", type=int, default=list(PACK_SIZES))
+    parser.add_argument("--tracking", nargs="+", default=list(TRACKING_TYPES), choices=TRACKING_TYPES)
+    parser.add_argument("--engines", nargs="+", default=list(ENGINES), choices=ENGINES)
+    parser.add_argument("--steps", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write the scenario results to this file")
+    parser.add_argument("--profile-dir", help="write a profile of every scenario's steps into this directory")
+    parser.add_argument("--profiler", default="cprofile", choices=("cprofile", "pyinstrument"))
+    args = parser.parse_args(argv)
+
+    if args.command == "compare":
+        if len(args.files) != 2:
+            parser.error("compare needs a baseline and a current results file")
+        baseline, current = [load_results(name) for name in args.files]
+        return compare_results(baseline, current)
+    if args.command == "scenarios":
+        results = bench_scenarios(args.datasets, args.sizes, args.tracking, args.engines, args.steps, args.seed,
+                                  args.profile_dir, args.profiler)
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump(results, f, indent=1)
+        return results
+
+    np.random.seed(0)
+    bench_imports()
+    bench_construction()
+    bench_pathfinding()
+    bench_pack_step()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Checkpointing for long Wolfsim batch sweeps
+
+RunStore appends every finished run's record to a JSON-lines file, so an interrupted sweep can skip what is already
+done when restarted. save_snapshot/load_snapshot pickle an in-progress WolfModel (agents, packs, collars and random
+generator states) so a long simulation can resume mid-run; the shared terrain is left out and re-attached on load.
+"""
+
+import json
+import os
+import pickle
+
+import numpy as np
+
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError("{!r} is not JSON serializable".format(value))
+
+
+def run_key(params, iteration):
+    """Identifier of one run of a sweep: its variable parameters and iteration number."""
+    return json.dumps([sorted(params.items()), iteration], default=_json_default)
+
+
+def _write_atomic(path, data):
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    tmp = "{}.{}.tmp".format(path, os.getpid())
+    with open(tmp, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class RunStore():
+    """Append-only JSON-lines file holding one record per finished run."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        """Records of all runs completed so far; a line cut short by a crash is ignored."""
+        records = []
+        if not os.path.exists(self.path):
+            return records
+        with open(self.path, 'r') as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    pass
+        return records
+
+    def completed(self, parameter_names):
+        return {run_key({name: record[name] for name in parameter_names}, record["Iteration"])
+                for record in self.load()}
+
+    def append(self, record):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(record, default=_json_default) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def save_snapshot(model, path):
+    """Write the full state of a running model, including numpy's global random state, to path."""
+    state = {"model": model, "numpy_random": np.random.get_state()}
+    _write_atomic(path, pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def load_snapshot(path, terrain):
+    """Restore a model saved by save_snapshot onto the given TerrainContext, and restore numpy's random state."""
+    with open(path, 'rb') as f:
+        state = pickle.load(f)
+    model = state["model"]
+    model.attach_terrain(terrain)
+    np.random.set_state(state["numpy_random"])
+    return model
@@ -0,0 +1,102 @@
+"""
+Collar reliability for the Wolfsim model
+
+A collar's health (percent) depends only on its type and the simulation day, so CollarModel evaluates one curve per
+collar type over the simulation horizon into a (types, days) lookup table, growing it if a run goes on longer. Each
+day the health of every working collar is read from the table in one indexing operation, and collars at or below the
+failure level stop working (their type becomes 0, no collar). Curves are pluggable: anything with a
+health(years) method taking an array of ages in years will do.
+"""
+
+import numpy as np
+
+from utils import weibull_distribution
+
+FAILURE_HEALTH = 1  # percent, a collar at or below this has failed
+
+
+class WeibullCurve():
+    """Health as 100x the Weibull density of the collar age, the original wear and tear of both collar types."""
+
+    def __init__(self, scale, shape):
+        self.dist = weibull_distribution(scale, shape)
+
+    def health(self, years):
+        with np.errstate(divide="ignore"):
+            return self.dist.weib(years) * 100
+
+
+class BatteryCurve():
+    """GPS battery: full health until the battery starts draining at life - drain years, empty at life years."""
+
+    def __init__(self, life=2.0, drain=0.25):
+        self.life = life
+        self.drain = drain
+
+    def health(self, years):
+        return np.clip((self.life - years) / self.drain, 0, 1) * 100
+
+
+class HalfLifeCurve():
+    """
+    Health halving every half_life years, e.g. a radio collar's slowly weakening battery. Only the failure level reads
+    health, so this sets when the collar stops working; detection range does not change with it.
+    """
+
+    def __init__(self, half_life=3.0):
+        self.half_life = half_life
+
+    def health(self, years):
+        return 100 * 0.5 ** (years / self.half_life)
+
+
+# Collar Types[1: radio, 2:GPS]
+DEFAULT_CURVES = {1: WeibullCurve(1, 0.8), 2: WeibullCurve(1, 1)}
+
+
+class CollarModel():
+    """Per-day health lookup table of each collar type, and the daily wear of a set of collars."""
+
+    def __init__(self, curves=None, horizon=366, failure=FAILURE_HEALTH):
+        self.curves = dict(DEFAULT_CURVES if curves is None else curves)
+        if 0 in self.curves:
+            raise ValueError("collar type 0 means no collar and cannot have a curve")
+        self.failure = failure
+        self.types = max(self.curves, default=0) + 1
+        # collar types without a curve (0 included) keep their health, marked by NaN in the table
+        self.known = np.zeros(self.types, dtype=bool)
+        self.known[list(self.curves)] = True
+        self.table = np.empty((self.types, 0))
+        self._extend(horizon)
+
+    def _extend(self, day):
+        days = max(day + 1, 2 * self.table.shape[1])
+        years = np.arange(days) / 365
+        table = np.full((self.types, days), np.nan)
+        for collar_type, curve in self.curves.items():
+            table[collar_type] = curve.health(years)
+        self.table = table
+
+    def health(self, collar_type, day):
+        """Health of a working collar of collar_type on day, or None if the type has no curve."""
+        if day >= self.table.shape[1]:
+            self._extend(day)
+        if collar_type >= self.types or not self.known[collar_type]:
+            return None
+        return self.table[collar_type, day]
+
+    def wear(self, collar_type, collar_health, living, day):
+        """
+        One day of wear and tear for arrays of collars, in place: living wolves' collars above the failure level get
+        the day's health of their type, the others fail.
+        """
+        if day >= self.table.shape[1]:
+            self._extend(day)
+        working = living & (collar_health > self.failure)
+        worn = np.nonzero(working)[0]
+        types = collar_type[worn].astype(np.intp)
+        known = types < self.types
+        known[known] = self.known[types[known]]
+        worn, types = worn[known], types[known]
+        collar_health[worn] = self.table[types, day]
+        collar_type[living & ~working] = 0
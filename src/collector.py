@@ -0,0 +1,178 @@
+"""
+Columnar data collection for the Wolfsim model
+
+ColumnarCollector stands in for Mesa's DataCollector. It records the pack statistics that WolfModel.step has already
+computed, plus the alive/age/position state of every wolf, into preallocated numpy columns (samples x wolves) instead
+of lists of Python records. The agent columns can be sampled every few days, or streamed to result sinks instead of
+kept in memory. The model_vars, model_reporters and agent_reporters attributes and the dataframe getters keep the
+interface ChartModule and BatchRunner rely on. pandas is only imported to build the dataframes.
+"""
+
+from collections import OrderedDict
+
+import numpy as np
+
+from utils import compute_pack_health, compute_pack_position, compute_est_pack_position, compute_track_error, \
+    compute_track_error_average
+
+# name: (reporter for BatchRunner, shape of one sample)
+MODEL_COLUMNS = OrderedDict([
+    ("Pack Health", (compute_pack_health, ())),
+    ("Pack Position", (compute_pack_position, (2,))),
+    ("Pack Estimated Position", (compute_est_pack_position, (2,))),
+    ("Pack Track Error", (compute_track_error, ())),
+    ("Pack Average Track Error", (compute_track_error_average, ())),
+])
+AGENT_COLUMNS = OrderedDict([("Alive", bool), ("Age", np.float32), ("Pos", np.int32), ("Detected", bool),
+                             ("Collar", np.int8)])
+
+
+class ColumnarCollector():
+    """
+    Per-step model statistics and per-wolf state of one WolfModel in growable numpy columns.
+
+    capacity is the number of samples preallocated (the columns double when it runs out). Model statistics are
+    sampled every model_interval steps and the wolves every agent_interval steps; agent_interval=None records no
+    wolf state. After stream_to, samples go to the sinks as they are taken.
+    """
+
+    def __init__(self, model, capacity=366, model_interval=1, agent_interval=1):
+        self.model_interval = model_interval
+        self.agent_interval = agent_interval
+        self.model_reporters = OrderedDict((name, reporter) for name, (reporter, _) in MODEL_COLUMNS.items())
+        self.agent_reporters = OrderedDict((name, name.lower()) for name in AGENT_COLUMNS)
+        if model.pack is None:
+            self.wolves = [agent for agent in model.schedule.agents if agent.type == 4]
+            self.wolf_ids = np.array([wolf.unique_id for wolf in self.wolves], dtype=np.int64)
+        else:
+            self.wolves = None
+            self.wolf_ids = np.arange(len(model.pack), dtype=np.int64)
+        n = len(self.wolf_ids)
+
+        self.model_steps = np.zeros(capacity, dtype=np.int64)
+        self.model_columns = {name: np.zeros((capacity,) + shape) for name, (_, shape) in MODEL_COLUMNS.items()}
+        self.model_count = 0
+        self.agent_steps = np.zeros(capacity, dtype=np.int64)
+        self.agent_columns = {name: np.zeros((capacity, n) + ((2,) if name == "Pos" else ()), dtype=dtype)
+                              for name, dtype in AGENT_COLUMNS.items()}
+        self.agent_count = 0
+        self.run = 0
+        self.agent_sink = None
+        self.model_sink = None
+
+    def stream_to(self, agent_sink=None, model_sink=None, run=0):
+        """
+        Write wolf samples (AGENT_SCHEMA rows) to agent_sink instead of keeping them, and copy the model statistics
+        (MODEL_SCHEMA rows) to model_sink; both are tagged with run.
+        """
+        self.agent_sink = agent_sink
+        self.model_sink = model_sink
+        self.run = run
+        if agent_sink is not None:
+            # the preallocated wolf columns are not needed while streaming
+            self.agent_columns = {name: column[:0] for name, column in self.agent_columns.items()}
+            self.agent_steps = self.agent_steps[:0]
+            self.agent_count = 0
+
+    @staticmethod
+    def _reserve(columns, steps, count):
+        if count < len(steps):
+            return steps
+        capacity = max(2 * len(steps), 1)
+        for name, column in columns.items():
+            grown = np.zeros((capacity,) + column.shape[1:], dtype=column.dtype)
+            grown[:count] = column
+            columns[name] = grown
+        grown = np.zeros(capacity, dtype=steps.dtype)
+        grown[:count] = steps
+        return grown
+
+    def collect(self, model):
+        """Record the current step, reading the statistics WolfModel.step computed for it."""
+        step = model.schedule.steps
+        if self.model_interval and step % self.model_interval == 0:
+            self.model_steps = self._reserve(self.model_columns, self.model_steps, self.model_count)
+            k = self.model_count
+            columns = self.model_columns
+            columns["Pack Health"][k] = compute_pack_health(model)
+            columns["Pack Position"][k] = model.avg_pos
+            columns["Pack Estimated Position"][k] = model.tracked_position
+            columns["Pack Track Error"][k] = model.track_error
+            columns["Pack Average Track Error"][k] = compute_track_error_average(model)
+            self.model_steps[k] = step
+            self.model_count += 1
+            if self.model_sink is not None:
+                position, estimate = columns["Pack Position"][k], columns["Pack Estimated Position"][k]
+                self.model_sink.write(run=self.run, step=step, health=columns["Pack Health"][k], x=position[0],
+                                      y=position[1], est_x=estimate[0], est_y=estimate[1],
+                                      track_error=columns["Pack Track Error"][k],
+                                      average_track_error=columns["Pack Average Track Error"][k])
+        if self.agent_interval and step % self.agent_interval == 0:
+            sample = self.sample_wolves(model)
+            if self.agent_sink is not None:
+                pos = sample["Pos"]
+                self.agent_sink.write(run=self.run, step=step, wolf=self.wolf_ids, x=pos[:, 0], y=pos[:, 1],
+                                      alive=sample["Alive"], age=sample["Age"], detected=sample["Detected"],
+                                      collar=sample["Collar"])
+                return
+            self.agent_steps = self._reserve(self.agent_columns, self.agent_steps, self.agent_count)
+            k = self.agent_count
+            for name, values in sample.items():
+                self.agent_columns[name][k] = values
+            self.agent_steps[k] = step
+            self.agent_count += 1
+
+    def sample_wolves(self, model):
+        """Current state of every wolf, one array per agent column."""
+        if self.wolves is None:
+            pack = model.pack
+            return {"Alive": pack.alive, "Age": pack.age, "Pos": pack.pos, "Detected": pack.detected,
+                    "Collar": pack.collar_type}
+        n = len(self.wolves)
+        return {"Alive": np.fromiter((wolf.alive for wolf in self.wolves), dtype=bool, count=n),
+                "Age": np.fromiter((wolf.age for wolf in self.wolves), dtype=float, count=n),
+                "Pos": np.array([wolf.pos for wolf in self.wolves], dtype=np.int32).reshape(n, 2),
+                "Detected": np.fromiter((wolf.detected for wolf in self.wolves), dtype=bool, count=n),
+                "Collar": np.fromiter((wolf.collar_type for wolf in self.wolves), dtype=np.int8, count=n)}
+
+    def model_column(self, name):
+        """Recorded samples of one model statistic, shape (samples,) or (samples, 2) for positions."""
+        return self.model_columns[name][:self.model_count]
+
+    def agent_column(self, name):
+        """Recorded samples of one wolf variable, shape (samples, wolves) or (samples, wolves, 2) for Pos."""
+        return self.agent_columns[name][:self.agent_count]
+
+    @property
+    def model_vars(self):
+        return {name: self.model_column(name) for name in self.model_columns}
+
+    @property
+    def model_steps_recorded(self):
+        return self.model_steps[:self.model_count]
+
+    @property
+    def agent_steps_recorded(self):
+        return self.agent_steps[:self.agent_count]
+
+    def get_model_vars_dataframe(self):
+        import pandas as pd
+
+        data = OrderedDict()
+        for name, column in self.model_vars.items():
+            data[name] = list(column) if column.ndim > 1 else column
+        return pd.DataFrame(data, index=pd.Index(self.model_steps_recorded, name="Step"))
+
+    def get_agent_vars_dataframe(self):
+        """One row per (Step, AgentID) like DataCollector's, wolves only."""
+        import pandas as pd
+
+        samples, n = self.agent_count, len(self.wolf_ids)
+        index = pd.MultiIndex.from_arrays([np.repeat(self.agent_steps_recorded, n), np.tile(self.wolf_ids, samples)],
+                                          names=["Step", "AgentID"])
+        pos = self.agent_column("Pos").reshape(-1, 2)
+        return pd.DataFrame({"Alive": self.agent_column("Alive").ravel(),
+                             "Age": self.agent_column("Age").ravel(),
+                             "Pos": list(zip(pos[:, 0].tolist(), pos[:, 1].tolist())),
+                             "Detected": self.agent_column("Detected").ravel(),
+                             "Collar": self.agent_column("Collar").ravel()}, index=index)
@@ -0,0 +1,66 @@
+"""
+Batched territorial conflicts between co-located wolves
+
+Once per step the living wolves are grouped by cell with np.unique. Every wolf older than ATTACK_AGE that shares its
+cell with other living wolves attacks; the kill rolls of all attackers are made at once, and each successful attacker
+kills a random other wolf on its cell. Attacks are resolved simultaneously, so a wolf killed this step still gets its
+own attack, and only wolves are ever victims.
+"""
+
+import numpy as np
+
+ATTACK_AGE = 5  # years, wolves attack once older than this (territorial)
+ATTACK_ODDS = 5000  # an attack kills when randint(1, ATTACK_ODDS) comes up 1
+
+
+def living_wolves(model):
+    """Cell ids and ages of the living wolves, and a function killing a subset of them."""
+    height = model.grid.height
+    if model.pack is not None:
+        pack = model.pack
+        index = np.nonzero(pack.alive)[0]
+
+        def kill(victims):
+            pack.alive[index[victims]] = False
+        return pack.pos[index, 0] * height + pack.pos[index, 1], pack.age[index], kill
+
+    wolves = [agent for agent in model.schedule.agents if agent.type == 4 and agent.alive == True]
+
+    def kill(victims):
+        for i in victims.tolist():
+            wolves[i].alive = False
+    cells = np.fromiter((wolf.pos[0] * height + wolf.pos[1] for wolf in wolves), dtype=np.int64, count=len(wolves))
+    ages = np.fromiter((wolf.age for wolf in wolves), dtype=float, count=len(wolves))
+    return cells, ages, kill
+
+
+def choose_victims(cells, ages, rng=np.random):
+    """Indices of the wolves killed by the attacks among wolves on the given cells with the given ages."""
+    _, group, counts = np.unique(cells, return_inverse=True, return_counts=True)
+    attackers = np.nonzero((counts[group] > 1) & (ages > ATTACK_AGE))[0]
+    if not len(attackers):
+        return attackers
+    attackers = attackers[rng.randint(1, ATTACK_ODDS, len(attackers)) < 2]
+    if not len(attackers):
+        return attackers
+
+    # wolves sorted by cell: each cell's wolves are the slice starts[g]:starts[g] + counts[g] of order
+    order = np.argsort(group, kind="stable")
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+    cell = group[attackers]
+    # pick one of the other count - 1 wolves on the cell by skipping over the attacker's own slot
+    choice = (rng.random_sample(len(attackers)) * (counts[cell] - 1)).astype(np.int64)
+    choice += choice >= rank[attackers] - starts[cell]
+    return np.unique(order[starts[cell] + choice])
+
+
+def resolve_attacks(model):
+    """Run the conflict stage of one step for all living wolves of the model."""
+    cells, ages, kill = living_wolves(model)
+    if len(cells) < 2:
+        return
+    victims = choose_victims(cells, ages, model.pack.rng if model.pack is not None else np.random)
+    if len(victims):
+        kill(victims)
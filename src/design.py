@@ -0,0 +1,136 @@
+"""
+Space-filling experiment designs and sensitivity analysis for Wolfsim sweeps
+
+A design space maps WolfModel parameter names to Continuous, Integer or Categorical ranges. latin_hypercube and
+sobol draw points from the unit cube with scipy.stats.qmc and map them onto the space, giving parameter dicts to run
+with ParallelBatchRunner(points=...) in place of a full-factorial grid. SensitivityDesign builds the Saltelli scheme
+(base matrices A and B plus one matrix per parameter taking that column from B) and estimates first-order (Saltelli
+2010) and total (Jansen) Sobol indices of a reporter from the runs' results.
+"""
+
+from collections import OrderedDict
+
+import numpy as np
+
+
+class Continuous():
+    """Real parameter uniform on [low, high]."""
+
+    def __init__(self, low, high):
+        self.low = low
+        self.high = high
+
+    def values(self, unit):
+        return [float(value) for value in self.low + unit * (self.high - self.low)]
+
+
+class Integer():
+    """Integer parameter uniform on low..high, both included."""
+
+    def __init__(self, low, high):
+        self.low = low
+        self.high = high
+
+    def values(self, unit):
+        steps = self.high - self.low + 1
+        return [int(value) for value in self.low + np.minimum(np.floor(unit * steps), steps - 1)]
+
+
+class Categorical():
+    """Parameter taking one of a list of values (tracking types, tracker layouts) with equal probability."""
+
+    def __init__(self, choices):
+        self.choices = list(choices)
+
+    def values(self, unit):
+        index = np.minimum(np.floor(unit * len(self.choices)).astype(int), len(self.choices) - 1)
+        return [self.choices[i] for i in index.tolist()]
+
+
+def _qmc_engine(method, dimensions, seed):
+    from scipy.stats import qmc
+
+    engine = {"lhs": qmc.LatinHypercube, "sobol": qmc.Sobol}.get(method)
+    if engine is None:
+        raise ValueError("unknown design method {!r}, expected 'lhs' or 'sobol'".format(method))
+    try:
+        return engine(dimensions, rng=seed)
+    except TypeError:  # scipy before 1.15
+        return engine(dimensions, seed=seed)
+
+
+def unit_sample(dimensions, n, method="sobol", seed=None):
+    """n points of the dimensions-dimensional unit cube; Sobol samples are best taken in powers of two."""
+    engine = _qmc_engine(method, dimensions, seed)
+    if method == "sobol" and n & (n - 1) == 0:
+        return engine.random_base2(int(np.log2(n)))
+    return engine.random(n)
+
+
+def map_points(space, unit):
+    """Parameter dicts of the rows of a (n, len(space)) unit cube sample."""
+    columns = [parameter.values(unit[:, k]) for k, parameter in enumerate(space.values())]
+    return [dict(zip(space, row)) for row in zip(*columns)]
+
+
+def latin_hypercube(space, n, seed=None):
+    return map_points(space, unit_sample(len(space), n, "lhs", seed))
+
+
+def sobol(space, n, seed=None):
+    return map_points(space, unit_sample(len(space), n, "sobol", seed))
+
+
+class SensitivityDesign():
+    """
+    Saltelli design of n base points over a space, n * (len(space) + 2) points in all, ordered A, B, AB_1..AB_d.
+    Run the points (any number of iterations each) and pass the reporter's values to indices.
+    """
+
+    def __init__(self, space, n, method="sobol", seed=None):
+        self.space = OrderedDict(space)
+        self.n = n
+        d = len(self.space)
+        base = unit_sample(2 * d, n, method, seed)
+        a, b = base[:, :d], base[:, d:]
+        blocks = [a, b]
+        for k in range(d):
+            ab = a.copy()
+            ab[:, k] = b[:, k]
+            blocks.append(ab)
+        self.unit = np.concatenate(blocks)
+        self.points = map_points(self.space, self.unit)
+
+    def point_means(self, values, runs=None, iterations=1):
+        """
+        Mean value per design point. values are in run order, iterations runs per point as ParallelBatchRunner
+        numbers them; or give the Run numbers of the values in runs.
+        """
+        values = np.asarray(values, dtype=float)
+        runs = np.arange(len(values)) if runs is None else np.asarray(runs)
+        point = runs // iterations
+        counts = np.bincount(point, minlength=len(self.points))
+        return np.bincount(point, weights=values, minlength=len(self.points)) / counts
+
+    def indices(self, values, runs=None, iterations=1):
+        """
+        First-order and total Sobol indices of each parameter for a reporter: OrderedDict name -> (S1, ST).
+        """
+        f = self.point_means(values, runs, iterations)
+        n, d = self.n, len(self.space)
+        f_a, f_b = f[:n], f[n:2 * n]
+        variance = np.var(np.concatenate([f_a, f_b]))
+        result = OrderedDict()
+        for k, name in enumerate(self.space):
+            f_ab = f[(2 + k) * n:(3 + k) * n]
+            first = np.mean(f_b * (f_ab - f_a)) / variance
+            total = 0.5 * np.mean((f_a - f_ab) ** 2) / variance
+            result[name] = (float(first), float(total))
+        return result
+
+    def indices_dataframe(self, run_data, reporter, iterations=1):
+        """Indices of a reporter from a batch runner's model vars dataframe, one row per parameter."""
+        import pandas as pd
+
+        indices = self.indices(run_data[reporter].values, run_data["Run"].values, iterations)
+        return pd.DataFrame([(name, s1, st) for name, (s1, st) in indices.items()], columns=["parameter", "S1", "ST"])
@@ -0,0 +1,124 @@
+"""
+Batched detection of collared wolves by the trackers
+
+The collared wolves' positions are indexed once per step in a KD-tree, every tracker that scans that day is answered
+with one range query, and the satellite / distance-decay detection rolls are made for all tracker-wolf pairs at once.
+"""
+
+import numpy as np
+
+from metrics import clock
+
+SATELLITE_DETECTION = 25  # percent chance a satellite picks up a collar in range
+TRACKER_TIMER = 5  # days between two flights / scans of a tracker
+TRACKER_RANGES = {"satellite": 1000, "stations": 100, "helicopters": 75, "planes": 100}  # detection range, cells
+
+
+def tracker_positions(tracking_type, sites):
+    """Where the trackers of a tracking type are placed; helicopters are based at the feeding sites."""
+    if tracking_type == "satellite":
+        return [(100, 100)]
+    if tracking_type == "stations":
+        return [(60, 100), (160, 100)]
+    if tracking_type == "helicopters":
+        return list(sites)
+    if tracking_type == "planes":
+        return [(100, 50), (0, 100), (50, 75), (116, 100), (133, 149), (150, 35), (199, 20)]
+    return []
+
+
+def tracker_schedule(tracking_type, time, timer, index):
+    """
+    Whether tracker number index (counted from 0 within the model's trackers) is active on day time, and whether it
+    scans for wolves. Aerial trackers fly in rotating groups.
+    """
+    if time % timer != 0:
+        return False, False
+    if tracking_type == "helicopters":
+        phase = time / timer % 4
+        if phase == 1:
+            active = index < 2
+        elif phase == 2:
+            active = 1 < index < 4
+        elif phase == 3:
+            active = 3 < index < 6
+        else:
+            # the last pair takes off but does not look for wolves
+            return 5 < index < 8, False
+        return active, active
+    if tracking_type == "planes":
+        phase = time / timer % 3
+        # tracker 0 flies with every group
+        if phase == 1:
+            active = 0 < index < 3 or index == 0
+        elif phase == 2:
+            active = 2 < index < 5 or index == 0
+        else:
+            active = 4 < index < 7 or index == 0
+        return active, active
+    return True, True
+
+
+def detection_chance(satellite, distance, dist):
+    """
+    Percent chance that a tracker with range dist detects a collar at distance inside it: SATELLITE_DETECTION for
+    the satellite, falling with the distance for the others. Every detection pass (the model's, the ensemble's and
+    the placement replay) rolls against it; arguments broadcast.
+    """
+    return np.where(satellite, SATELLITE_DETECTION, dist - distance / dist * 100)
+
+
+def collared_wolves(model):
+    """Positions of the living collared wolves and a function marking a subset of them as detected."""
+    if model.pack is not None:
+        pack = model.pack
+        index = np.nonzero(pack.alive & ((pack.collar_type == 1) | (pack.collar_type == 2)))[0]
+
+        def mark(hits):
+            pack.detected[index[hits]] = True
+        return pack.pos[index], mark
+
+    wolves = [agent for agent in model.schedule.agents
+              if agent.type == 4 and agent.alive == True and (agent.collar_type == 1 or agent.collar_type == 2)]
+
+    def mark(hits):
+        for i in hits.tolist():
+            wolves[i].detected = True
+    return np.array([wolf.pos for wolf in wolves], dtype=float).reshape(-1, 2), mark
+
+
+def detect_wolves(model, trackers):
+    """
+    Run the detection pass of every scanning tracker against the collared wolves in one batch. With metrics, each
+    tracker's scan is counted under "detect_nearby" at its share of the batch.
+    """
+    if not trackers:
+        return
+    metrics = model.metrics
+    start = clock() if metrics is not None else 0
+    positions, mark = collared_wolves(model)
+    if len(positions) > 0:
+        scan(positions, mark, trackers)
+    if metrics is not None:
+        metrics.add("detect_nearby", clock() - start, len(trackers))
+
+
+def scan(positions, mark, trackers):
+    """Detection rolls of the trackers for the wolves at positions, marking those found."""
+    from scipy.spatial import cKDTree  # deferred so that importing the model does not load scipy.spatial
+
+    centres = np.array([tracker.pos for tracker in trackers], dtype=float)
+    ranges = np.array([tracker.dist for tracker in trackers], dtype=float)
+    in_range = cKDTree(positions).query_ball_point(centres, r=ranges)
+
+    tracker_index = np.repeat(np.arange(len(trackers)), [len(found) for found in in_range])
+    wolf_index = np.fromiter((i for found in in_range for i in found), dtype=np.int64, count=len(tracker_index))
+    distance = np.linalg.norm(positions[wolf_index] - centres[tracker_index], axis=1)
+    # the range query includes the boundary, the detection range does not
+    close = distance < ranges[tracker_index]
+    tracker_index, wolf_index, distance = tracker_index[close], wolf_index[close], distance[close]
+
+    satellite = np.array([tracker.tracking_type == "satellite" for tracker in trackers])[tracker_index]
+    chance = detection_chance(satellite, distance, ranges[tracker_index])
+    hits = chance > np.random.randint(0, 100, len(wolf_index))
+    mark(np.unique(wolf_index[hits]))
@@ -0,0 +1,349 @@
+"""
+Lockstep replicate ensembles of the Wolfsim model
+
+An Ensemble runs R replicates of one scenario together: the state of every wolf of every replicate is held in
+(replicates, wolves) arrays, and each day movement, mortality, conflicts, collar wear, detection and the pack
+centroid / track error statistics are computed for all replicates at once, following the rules of the vectorized
+WolfModel. Only route planning stays per pack, and its requests are served in one batch for the whole ensemble.
+Terrain, routes and the tracker layout are shared by all replicates.
+
+Replicates draw from the ensemble's own generator, so they are independent runs of the scenario but do not repeat
+the runs separate WolfModels with the same seeds would make. replicate(r) gives a model-like view of one replicate
+for reporters reading the pack arrays, such as compute_pack_health and compute_track_error_average, and
+run_ensemble returns their values per replicate in the shape ParallelBatchRunner records.
+"""
+
+from collections import OrderedDict
+
+import numpy as np
+
+from collars import CollarModel
+from conflict import choose_victims
+from detection import TRACKER_RANGES, TRACKER_TIMER, detection_chance, tracker_positions, tracker_schedule
+from pack import Pack, choose_moves, move_options
+from terrain import TerrainContext
+from utils import choose_feeding_site, compute_territorial_retreats, feeding_site_candidates
+
+# WolfModel parameters an ensemble takes; the others only concern one model's bookkeeping and display
+ENSEMBLE_PARAMETERS = ("N", "width", "height", "elev", "veg", "tracking_type", "n_collars", "n_packs", "terrain",
+                       "collars", "tracker_dist", "tracker_timer", "tracker_layout")
+HISTORY_COLUMNS = ("Pack Health", "Pack Position", "Pack Estimated Position", "Pack Track Error",
+                   "Pack Average Track Error")
+
+
+class ReplicateWolves():
+    """Rows of one replicate in the ensemble's wolf arrays, in the layout of a WolfPack."""
+
+    def __init__(self, ensemble, replicate):
+        self.ensemble = ensemble
+        self.replicate = replicate
+        self.pack_id = ensemble.pack_id
+
+    def __len__(self):
+        return self.ensemble.num_agents
+
+    @property
+    def alive(self):
+        return self.ensemble.alive[self.replicate]
+
+    @property
+    def age(self):
+        return self.ensemble.age[self.replicate]
+
+    @property
+    def pos(self):
+        return self.ensemble.pos[self.replicate]
+
+    @property
+    def detected(self):
+        return self.ensemble.detected[self.replicate]
+
+    @property
+    def collar_type(self):
+        return self.ensemble.collar_type[self.replicate]
+
+    @property
+    def collar_health(self):
+        return self.ensemble.collar_health[self.replicate]
+
+
+class Replicate():
+    """Model-like view of one replicate of an ensemble, for reporters and the pack helpers in utils."""
+
+    def __init__(self, ensemble, replicate):
+        self.ensemble = ensemble
+        self.replicate = replicate
+        self.pack = ReplicateWolves(ensemble, replicate)
+        self.packs = ensemble.packs[replicate]
+        self.sites = ensemble.sites
+        self.num_agents = ensemble.num_agents
+        self.width = ensemble.width
+        self.height = ensemble.height
+        self.tracking_type = ensemble.tracking_type
+
+    @property
+    def time(self):
+        return self.ensemble.time
+
+    @property
+    def avg_pos(self):
+        return self.ensemble.avg_pos[self.replicate]
+
+    @property
+    def tracked_position(self):
+        return self.ensemble.tracked_position[self.replicate]
+
+    @property
+    def track_error(self):
+        return self.ensemble.track_error[self.replicate]
+
+    @property
+    def track_error_sum(self):
+        return self.ensemble.track_error_sum[self.replicate]
+
+    @property
+    def target(self):
+        return self.packs[0].target
+
+    @property
+    def path(self):
+        return self.packs[0].path
+
+
+class Ensemble():
+    """R replicates of a WolfModel scenario advanced in lockstep on (replicates, wolves) arrays."""
+
+    def __init__(self, N, width, height, elev, veg, replicates=1, tracking_type="planes", n_collars=1, n_packs=1,
+                 terrain=None, seed=None, collars=None, tracker_dist=None, tracker_timer=None, tracker_layout=None):
+        self.num_agents = N
+        self.width = width
+        self.height = height
+        self.replicates = replicates
+        self.tracking_type = tracking_type
+        self.rng = np.random.RandomState(None if seed is None else seed % 2 ** 32)
+        self.time = 0
+        self.collars = CollarModel() if collars is None else collars
+        if terrain is None:
+            terrain = TerrainContext.get(elev, veg, width, height)
+        self.routes = terrain.routes
+        self.sites = list(terrain.sites)
+        self.size = np.array([width, height])
+
+        # every replicate picks its packs' first feeding sites as WolfModel does
+        num_sites = len(self.sites)
+        self.packs = []
+        for _ in range(replicates):
+            packs = []
+            for p in range(n_packs):
+                candidates = feeding_site_candidates(num_sites, [pack.target for pack in packs])
+                target = candidates[self.rng.randint(len(candidates))]
+                packs.append(Pack(p, target, self.sites))
+            self.packs.append(packs)
+
+        # wolves split into n_packs contiguous packs each with n_collars collared wolves, the same in every replicate
+        collar_code = 2 if tracking_type == "satellite" else 1
+        self.pack_id = np.arange(N) * n_packs // max(N, 1)
+        rank_in_pack = np.arange(N) - np.searchsorted(self.pack_id, self.pack_id)
+        shape = (replicates, N)
+        self.age = self.rng.randint(1, 5, shape).astype(float)
+        self.alive = np.ones(shape, dtype=bool)
+        self.detected = np.zeros(shape, dtype=bool)
+        self.collar_type = np.array(np.broadcast_to(np.where(rank_in_pack < n_collars, collar_code, 0), shape),
+                                    dtype=np.int8)
+        self.collar_health = np.full(shape, 100.0)
+        targets = np.array([[pack.target for pack in packs] for packs in self.packs], dtype=np.int64).reshape(
+            replicates, n_packs)
+        sites = np.array(self.sites, dtype=np.int64)
+        self.pos = sites[targets[:, self.pack_id]].reshape(replicates, N, 2)
+
+        self.avg_pos = np.zeros((replicates, 2))
+        self.tracked_position = sites[targets[:, 0]].astype(float)
+        self.pack_estimates = sites[targets].astype(float)  # (replicates, packs, 2), see update_pack_statistics
+        self.track_error = np.zeros(replicates)
+        self.track_error_sum = np.zeros(replicates)
+
+        if tracker_layout is None:
+            tracker_layout = tracker_positions(tracking_type, self.sites)
+        self.tracker_pos = np.array(tracker_layout, dtype=float).reshape(-1, 2)
+        if tracker_dist is None:
+            tracker_dist = TRACKER_RANGES.get(tracking_type, 0)
+        self.tracker_dist = np.full(len(self.tracker_pos), float(tracker_dist))
+        self.timer = TRACKER_TIMER if tracker_timer is None else tracker_timer
+        self.history = OrderedDict((name, []) for name in HISTORY_COLUMNS)
+
+    def replicate(self, r):
+        return Replicate(self, r)
+
+    def views(self):
+        return [self.replicate(r) for r in range(self.replicates)]
+
+    def step(self):
+        """Advance every replicate by one day, in the order of WolfModel.step."""
+        self.time += 1
+        self.update_statistics()
+        self.collect()
+        self.retarget()
+        self.detected[:] = False
+        self.resolve_attacks()
+        self.step_wolves()
+        self.detect()
+
+    def run(self, steps):
+        for _ in range(steps):
+            self.step()
+
+    def update_statistics(self):
+        if len(self.packs[0]) > 1:
+            self.update_pack_statistics()
+            return
+        living = self.alive
+        counts = living.sum(axis=1)
+        detected = living & self.detected
+        detected_counts = detected.sum(axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            self.avg_pos = np.einsum("rn,rnk->rk", living, self.pos) / counts[:, None]
+            estimated = np.einsum("rn,rnk->rk", detected, self.pos) / detected_counts[:, None]
+        # a replicate with no wolf detected keeps its last estimate
+        self.tracked_position = np.where(detected_counts[:, None] > 0, estimated, self.tracked_position)
+        self.track_error = np.linalg.norm(self.avg_pos - self.tracked_position, axis=1)
+        self.track_error_sum += self.track_error
+
+    def update_pack_statistics(self):
+        """Track every pack on its own, as WolfModel.step does for several packs: pack 0's position, mean error."""
+        centroids, counts = self.pack_centroids()
+        detected, detected_counts = self.pack_centroids(self.alive & self.detected)
+        # a pack with no wolf detected keeps its last estimate
+        self.pack_estimates = np.where(detected_counts[..., None] > 0, detected, self.pack_estimates)
+        errors = np.linalg.norm(centroids - self.pack_estimates, axis=2)
+        tracked = counts > 0
+        with np.errstate(invalid="ignore", divide="ignore"):
+            self.track_error = np.where(tracked, errors, 0).sum(axis=1) / tracked.sum(axis=1)
+        self.avg_pos = centroids[:, 0]
+        self.tracked_position = self.pack_estimates[:, 0]
+        self.track_error_sum += self.track_error
+
+    def collect(self):
+        history = self.history
+        history["Pack Health"].append(self.alive.sum(axis=1) / self.num_agents)
+        history["Pack Position"].append(self.avg_pos)
+        history["Pack Estimated Position"].append(self.tracked_position)
+        history["Pack Track Error"].append(self.track_error)
+        history["Pack Average Track Error"].append(self.track_error_sum / self.time)
+
+    def model_column(self, name):
+        """Recorded daily values of one pack statistic, shape (days, replicates) or (days, replicates, 2)."""
+        return np.stack(self.history[name])
+
+    def pack_centroids(self, living=None):
+        """Centroids (replicates, packs, 2) and counts (replicates, packs) of every pack's living (or given) wolves."""
+        n_packs = len(self.packs[0])
+        living = self.alive if living is None else living
+        replicate = np.nonzero(living)[0]
+        group = replicate * n_packs + np.broadcast_to(self.pack_id, living.shape)[living]
+        positions = self.pos[living]
+        size = self.replicates * n_packs
+        counts = np.bincount(group, minlength=size)
+        sums = np.stack([np.bincount(group, weights=positions[:, k], minlength=size) for k in (0, 1)], axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            centroids = sums / counts[:, None]
+        return centroids.reshape(self.replicates, n_packs, 2), counts.reshape(self.replicates, n_packs)
+
+    def retarget(self):
+        """Move every pack along its path and route the packs done feeding, as compute_updated_target_pathing."""
+        centroids, counts = self.pack_centroids()
+        waypoints = np.array([[pack.path[0] for pack in packs] for packs in self.packs], dtype=float)
+        arrived = np.linalg.norm(centroids - waypoints, axis=2) <= 5.0
+        retargeting = []
+        for r, packs in enumerate(self.packs):
+            moving = []
+            for pack in packs:
+                if counts[r, pack.pack_id] == 0:
+                    continue
+                pack.avg_pos = centroids[r, pack.pack_id]
+                if arrived[r, pack.pack_id]:
+                    if len(pack.path) == 1:  # reached target position
+                        pack.feeding = pack.feeding + 1
+                        if pack.feeding >= 5:
+                            moving.append(pack)
+                    else:
+                        pack.path.pop(0)
+                else:
+                    pack.feeding = 0
+            if len(packs) > 1:
+                for pack in compute_territorial_retreats(self.replicate(r), centroids[r], counts[r]):
+                    if pack not in moving:
+                        moving.append(pack)
+            for pack in moving:
+                pack.target = choose_feeding_site(self.replicate(r), pack, self.rng)
+                pack.feeding = 0
+                retargeting.append(pack)
+
+        if retargeting:
+            requests = [(tuple(pack.avg_pos.astype(int)), self.sites[pack.target]) for pack in retargeting]
+            for pack, new_path in zip(retargeting, self.routes.paths(requests)):
+                pack.path = new_path
+
+    def resolve_attacks(self):
+        replicate, wolf = np.nonzero(self.alive)
+        if len(wolf) < 2:
+            return
+        # cells are numbered per replicate so that wolves of different replicates never meet
+        x, y = self.pos[replicate, wolf, 0], self.pos[replicate, wolf, 1]
+        cells = (replicate * self.width + x) * self.height + y
+        victims = choose_victims(cells, self.age[replicate, wolf], self.rng)
+        self.alive[replicate[victims], wolf[victims]] = False
+
+    def step_wolves(self):
+        """Mortality, ageing, collar wear and movement of every wolf, as WolfPack.step."""
+        # Chance that wolf is lost to health problems
+        self.alive &= ~(self.rng.randint(1, 10000, self.alive.shape) < 1)
+        living = self.alive.copy()
+        # Increase age by 1 day
+        self.age[living] += 1 / 365
+        # collar wear and tear, failure at 1%
+        self.collars.wear(self.collar_type.reshape(-1), self.collar_health.reshape(-1), living.reshape(-1),
+                          self.time)
+
+        replicate, wolf = np.nonzero(living)
+        if len(wolf) == 0:
+            return
+        # each wolf heads for its own pack's next waypoint and centroid
+        waypoints = np.array([[pack.path[0] for pack in packs] for packs in self.packs], dtype=float)
+        centroids = np.array([[pack.avg_pos for pack in packs] for packs in self.packs], dtype=float)
+        pack = self.pack_id[wolf]
+        options = move_options(self.pos[replicate, wolf], self.size)
+        choice = choose_moves(self.rng, options, waypoints[replicate, pack], centroids[replicate, pack])
+        self.pos[replicate, wolf] = options[np.arange(len(wolf)), choice]
+
+    def scanning(self):
+        """Indices of the trackers scanning today, the same in every replicate."""
+        return [index for index in range(len(self.tracker_pos))
+                if tracker_schedule(self.tracking_type, self.time, self.timer, index)[1]]
+
+    def detect(self):
+        """Detection pass of today's scanning trackers against the collared wolves of every replicate."""
+        scanning = self.scanning()
+        if not scanning:
+            return
+        replicate, wolf = np.nonzero(self.alive & ((self.collar_type == 1) | (self.collar_type == 2)))
+        if len(wolf) == 0:
+            return
+        centres, ranges = self.tracker_pos[scanning], self.tracker_dist[scanning]
+        distance = np.linalg.norm(self.pos[replicate, wolf, None, :] - centres[None, :, :], axis=2)
+        chance = detection_chance(self.tracking_type == "satellite", distance, ranges)
+        hits = (distance < ranges) & (chance > self.rng.randint(0, 100, distance.shape))
+        found = hits.any(axis=1)
+        self.detected[replicate[found], wolf[found]] = True
+
+
+def run_ensemble(kwargs, replicates, seed, model_reporters, max_steps):
+    """
+    Run replicates of the WolfModel scenario given by kwargs in lockstep for max_steps days, and return the
+    reporter values of each replicate. Parameters that only concern a single model (vectorized, space,
+    sample_interval, plot_movement, metrics) are ignored.
+    """
+    ensemble = Ensemble(replicates=replicates, seed=seed,
+                        **{name: value for name, value in kwargs.items() if name in ENSEMBLE_PARAMETERS})
+    ensemble.run(max_steps)
+    return [{name: reporter(replicate) for name, reporter in model_reporters.items()}
+            for replicate in ensemble.views()]
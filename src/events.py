@@ -0,0 +1,47 @@
+"""
+Model events for rendering and other observers
+
+A WolfModel publishes what happens during a step on its EventBus instead of drawing it:
+
+    "path"       a pack got a new route: model, pack, path
+    "positions"  the wolves moved: model, time, positions (n, 2), alive (n,)
+    "detection"  the trackers scanned: model, time, trackers, detected (k, 2) positions of the wolves picked up
+
+The model checks wants(event) before building a payload, so with no subscribers an event costs one dict lookup.
+Subscribers run synchronously in the simulation thread; slow work such as drawing should be handed off (see
+plotting.FrameExporter).
+"""
+
+from collections import defaultdict
+
+EVENTS = ("path", "positions", "detection")
+
+
+class EventBus():
+    """Subscribers of one model's events, called in subscription order."""
+
+    def __init__(self):
+        self._subscribers = defaultdict(list)
+
+    def subscribe(self, event, callback):
+        if event not in EVENTS:
+            raise ValueError("unknown event {!r}, expected one of {}".format(event, EVENTS))
+        self._subscribers[event].append(callback)
+        return callback
+
+    def unsubscribe(self, event, callback):
+        self._subscribers[event].remove(callback)
+
+    def wants(self, event):
+        return bool(self._subscribers.get(event))
+
+    def __getstate__(self):
+        # subscribers hold windows and worker pools, a pickled model (see checkpoint.py) starts without them
+        return {}
+
+    def __setstate__(self, state):
+        self._subscribers = defaultdict(list)
+
+    def emit(self, event, **payload):
+        for callback in self._subscribers.get(event, ()):
+            callback(**payload)
@@ -0,0 +1,131 @@
+"""
+Grid-based home-range estimation for Wolfsim packs
+
+Positions are binned onto the terrain grid and smoothed with a Gaussian kernel, either as separable 1-D filters or
+through the FFT, which gives the utilization distribution (UD) in O(cells) however many days were recorded. The
+p% home range is the smallest set of cells holding p% of the UD; its density threshold gives the contour and its
+cell count the area. batch_home_ranges estimates many runs at once, and plotting is left to plot_home_range.
+"""
+
+from collections import namedtuple
+
+import numpy as np
+from scipy import ndimage
+
+DEFAULT_PERCENTS = (50, 95)
+
+# ud: (width, height) probabilities; levels/areas: contour density and area (cells * cell_area) per percent
+HomeRange = namedtuple("HomeRange", ["ud", "percents", "levels", "areas", "bandwidth"])
+
+
+def scott_bandwidth(points):
+    """Per-axis kernel standard deviation by Scott's rule, as scipy.stats.gaussian_kde chooses it in 2-D."""
+    points = np.asarray(points, dtype=float)
+    if len(points) < 2:
+        return np.zeros(2)
+    return points.std(axis=0, ddof=1) * len(points) ** (-1 / 6)
+
+
+def bin_positions(points, width, height, weights=None):
+    """Count of (x, y) points per grid cell, shape (width, height); points are rounded to the nearest cell."""
+    cells = np.rint(np.asarray(points, dtype=float)).astype(np.int64).reshape(-1, 2) % [width, height]
+    flat = np.bincount(cells[:, 0] * height + cells[:, 1], weights=weights, minlength=width * height)
+    return flat.reshape(width, height).astype(float)
+
+
+def smooth(counts, bandwidth, method="separable", torus=True):
+    """
+    Gaussian smoothing of gridded counts over the last two axes. method is "separable" (1-D filters per axis) or
+    "fft" (which always wraps around the edges, like the model's torus).
+    """
+    sigma = np.broadcast_to(np.asarray(bandwidth, dtype=float), (2,))
+    full_sigma = (0,) * (counts.ndim - 2) + tuple(sigma)
+    if method == "fft":
+        return np.real(np.fft.ifft2(ndimage.fourier_gaussian(np.fft.fft2(counts), full_sigma)))
+    if method != "separable":
+        raise ValueError("unknown smoothing method {!r}".format(method))
+    return ndimage.gaussian_filter(counts, full_sigma, mode="wrap" if torus else "constant")
+
+
+def ud_levels(ud, percents=DEFAULT_PERCENTS, cell_area=1.0):
+    """
+    Density thresholds and areas of the percents% home ranges of one UD or a stack of them (..., width, height).
+    Returns (levels, areas), each shaped (..., len(percents)).
+    """
+    flat = ud.reshape(ud.shape[:-2] + (-1,))
+    ordered = -np.sort(-flat, axis=-1)
+    cumulative = np.cumsum(ordered, axis=-1)
+    cumulative /= cumulative[..., -1:]
+    targets = np.asarray(percents, dtype=float) / 100
+    # number of densest cells needed to reach each percentage of the distribution
+    counts = np.stack([(cumulative < target).sum(axis=-1) + 1 for target in targets], axis=-1)
+    counts = np.minimum(counts, flat.shape[-1])
+    levels = np.take_along_axis(ordered, counts - 1, axis=-1)
+    return levels, counts * cell_area
+
+
+def utilization_distribution(points, width, height, bandwidth=None, method="separable", torus=True):
+    """UD of a set of (x, y) positions on a width x height grid, normalised to sum to 1."""
+    if bandwidth is None:
+        bandwidth = scott_bandwidth(points)
+    ud = np.clip(smooth(bin_positions(points, width, height), bandwidth, method, torus), 0, None)
+    return ud / ud.sum()
+
+
+def estimate_home_range(points, width, height, percents=DEFAULT_PERCENTS, bandwidth=None, method="separable",
+                        torus=True, cell_area=1.0):
+    if bandwidth is None:
+        bandwidth = scott_bandwidth(points)
+    ud = utilization_distribution(points, width, height, bandwidth, method, torus)
+    levels, areas = ud_levels(ud, percents, cell_area)
+    return HomeRange(ud, tuple(percents), levels, areas, np.asarray(bandwidth, dtype=float))
+
+
+def batch_home_ranges(point_sets, width, height, percents=DEFAULT_PERCENTS, bandwidth=None, method="separable",
+                      torus=True, cell_area=1.0):
+    """
+    Home ranges of many runs. point_sets is a sequence of (days, 2) position arrays, or one (runs, days, 2) array.
+    Runs are binned together and, with a common bandwidth, smoothed in one call; with bandwidth=None each run gets
+    its own Scott bandwidth. Returns (uds (runs, width, height), levels (runs, percents), areas (runs, percents)).
+    """
+    point_sets = [np.asarray(points, dtype=float).reshape(-1, 2) for points in point_sets]
+    runs = len(point_sets)
+    cells = np.rint(np.concatenate(point_sets)).astype(np.int64) % [width, height]
+    run_index = np.repeat(np.arange(runs), [len(points) for points in point_sets])
+    counts = np.bincount((run_index * width + cells[:, 0]) * height + cells[:, 1], minlength=runs * width * height)
+    counts = counts.reshape(runs, width, height).astype(float)
+
+    if bandwidth is None:
+        uds = np.stack([smooth(counts[r], scott_bandwidth(point_sets[r]), method, torus) for r in range(runs)])
+    else:
+        uds = smooth(counts, bandwidth, method, torus)
+    uds = np.clip(uds, 0, None)
+    uds /= uds.sum(axis=(1, 2), keepdims=True)
+    levels, areas = ud_levels(uds, percents, cell_area)
+    return uds, levels, areas
+
+
+def pack_home_ranges(model, percents=DEFAULT_PERCENTS, **kwargs):
+    """Home ranges of a model's recorded true and tracked pack positions: {"true": HomeRange, "tracked": ...}."""
+    collector = model.datacollector
+    return {"true": estimate_home_range(collector.model_column("Pack Position"), model.width, model.height,
+                                        percents, **kwargs),
+            "tracked": estimate_home_range(collector.model_column("Pack Estimated Position"), model.width,
+                                           model.height, percents, **kwargs)}
+
+
+def plot_home_range(home_range, points=None, ax=None, title=None):
+    """Draw a UD with its home-range contours (and optionally the positions); returns the axes, does not show."""
+    import matplotlib.pyplot as plt
+
+    if ax is None:
+        _, ax = plt.subplots()
+    ud = home_range.ud
+    ax.imshow(ud.T, origin="lower", cmap=plt.cm.gist_earth_r)
+    ax.contour(ud.T, levels=np.sort(np.unique(home_range.levels)), colors="k", linewidths=0.8)
+    if points is not None:
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        ax.plot(points[:, 0], points[:, 1], 'k.', markersize=2)
+    if title is not None:
+        ax.set_title(title)
+    return ax
@@ -0,0 +1,107 @@
+"""
+Step-phase timing counters for the Wolfsim model
+
+A model's metrics attribute is None unless it is instrumented; the step then costs one None check per phase. With
+a StepMetrics attached, WolfModel.step times each of its phases, wolf moves are timed under "move" (per wolf) and
+the trackers' scans under "detect_nearby" (per scanning tracker), and every new pack route is counted with its
+length. Metrics of many runs can be merged, and to_dict / from_dict turn them into plain JSON-friendly data to send
+back from batch workers and store with the results.
+"""
+
+import time
+from collections import OrderedDict
+
+clock = time.perf_counter_ns
+
+
+class Counter():
+    """Count, total and maximum of a series of integer samples (durations in ns, path lengths)."""
+    __slots__ = ("count", "total", "max")
+
+    def __init__(self, count=0, total=0, max=0):
+        self.count = count
+        self.total = total
+        self.max = max
+
+    def add(self, value, count=1):
+        """Add a sample, or the total of count samples taken together (the max then sees their mean)."""
+        self.count += count
+        self.total += value
+        if value // count > self.max:
+            self.max = value // count
+
+    def merge(self, other):
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def to_dict(self):
+        return {"count": self.count, "total": self.total, "max": self.max,
+                "mean": self.total / self.count if self.count else 0.0}
+
+
+class StepMetrics():
+    """Named phase timers (ns), the number of pack retargets and the lengths of the routes they were given."""
+
+    def __init__(self):
+        self.timers = OrderedDict()
+        self.retargets = 0
+        self.path_lengths = Counter()
+
+    def add(self, name, elapsed, calls=1):
+        """Record elapsed ns under name, as the total of calls calls when a batch does the work of several."""
+        timer = self.timers.get(name)
+        if timer is None:
+            timer = self.timers[name] = Counter()
+        timer.add(elapsed, calls)
+
+    def lap(self, name, start):
+        """Record the time since start under name, and return the current clock for the next phase."""
+        now = clock()
+        self.add(name, now - start)
+        return now
+
+    def route(self, path):
+        self.retargets += 1
+        self.path_lengths.add(len(path))
+
+    def merge(self, other):
+        for name, timer in other.timers.items():
+            if name not in self.timers:
+                self.timers[name] = Counter()
+            self.timers[name].merge(timer)
+        self.retargets += other.retargets
+        self.path_lengths.merge(other.path_lengths)
+        return self
+
+    @classmethod
+    def merged(cls, metrics):
+        total = cls()
+        for other in metrics:
+            total.merge(other)
+        return total
+
+    def to_dict(self):
+        """{"timers": {name: {count, total, max, mean} in ns}, "retargets": n, "path_lengths": {...}}"""
+        return {"timers": OrderedDict((name, timer.to_dict()) for name, timer in self.timers.items()),
+                "retargets": self.retargets, "path_lengths": self.path_lengths.to_dict()}
+
+    @classmethod
+    def from_dict(cls, data):
+        metrics = cls()
+        for name, timer in data["timers"].items():
+            metrics.timers[name] = Counter(timer["count"], timer["total"], timer["max"])
+        metrics.retargets = data["retargets"]
+        lengths = data["path_lengths"]
+        metrics.path_lengths = Counter(lengths["count"], lengths["total"], lengths["max"])
+        return metrics
+
+    def summary(self):
+        lines = ["{:<12} {:>9} {:>12} {:>12} {:>12}".format("phase", "calls", "total ms", "mean us", "max us")]
+        for name, timer in self.timers.items():
+            mean = timer.total / timer.count if timer.count else 0
+            lines.append("{:<12} {:>9} {:>12.2f} {:>12.2f} {:>12.2f}".format(
+                name, timer.count, timer.total / 1e6, mean / 1e3, timer.max / 1e3))
+        lines.append("retargets {}, mean path length {:.1f}, longest {}".format(
+            self.retargets, self.path_lengths.to_dict()["mean"], self.path_lengths.max))
+        return "\n".join(lines)
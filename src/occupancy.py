@@ -0,0 +1,127 @@
+"""
+Array-backed space for the Wolfsim model
+
+ArrayGrid answers the MultiGrid calls the model, the agents and Mesa's CanvasGrid make, without one Python list per
+cell and one agent per out-of-bound terrain cell. Terrain is kept as static (width, height) arrays and handed out as
+LandCell views when a cell's contents are asked for. The agents on the grid (wolves, trackers and feeding sites) are
+kept in a dict holding only the occupied cells; conflict.py finds the wolves sharing a cell from the wolves'
+positions, which works for both wolf engines. Cell contents come back in the order MultiGrid would give them
+(terrain first, then agents in placement order), and neighbourhoods in MultiGrid's sorted order, so models step the
+same on either space.
+"""
+
+import numpy as np
+
+NO_LAND = -1  # land_type of cells without a land agent
+
+
+class LandCell():
+    """View of one terrain cell, standing in for the land agent MultiGrid would store there."""
+    # alive is writable like on the Environment agents, which code handling cell contents as agents may set
+    __slots__ = ("type", "pos", "elevation", "alive")
+
+    def __init__(self, land_type, pos, elevation):
+        self.type = land_type
+        self.pos = pos
+        self.elevation = elevation
+
+
+class ArrayGrid():
+    """Toroidal (or bounded) width x height grid of static terrain plus a sparse set of agents."""
+
+    def __init__(self, width, height, torus=True):
+        self.width = width
+        self.height = height
+        self.torus = torus
+        self.land_type = np.full((width, height), NO_LAND, dtype=np.int16)
+        self.land_elevation = np.zeros((width, height), dtype=np.float32)
+        self.occupants = {}  # (x, y) -> agents on the cell in placement order, occupied cells only
+        self._neighborhood_cache = {}
+
+    def set_land(self, cells, land_type):
+        """Record the terrain cells (xs, ys, values) of one Environment class, in place of placing land agents."""
+        xs, ys, values = cells
+        self.land_type[xs, ys] = land_type.type
+        self.land_elevation[xs, ys] = values
+
+    def torus_adj(self, pos):
+        if not self.out_of_bounds(pos):
+            return pos
+        if not self.torus:
+            raise Exception("Point out of bounds, and space non-toroidal.")
+        return pos[0] % self.width, pos[1] % self.height
+
+    def out_of_bounds(self, pos):
+        x, y = pos
+        return x < 0 or x >= self.width or y < 0 or y >= self.height
+
+    def get_neighborhood(self, pos, moore, include_center=False, radius=1):
+        """Cells around pos, sorted, as MultiGrid.get_neighborhood returns them."""
+        key = (pos, moore, include_center, radius)
+        neighborhood = self._neighborhood_cache.get(key)
+        if neighborhood is None:
+            x, y = pos
+            coordinates = set()
+            for dy in range(-radius, radius + 1):
+                for dx in range(-radius, radius + 1):
+                    if dx == 0 and dy == 0 and not include_center:
+                        continue
+                    if not moore and abs(dx) + abs(dy) > radius:
+                        continue
+                    coord = (x + dx, y + dy)
+                    if self.out_of_bounds(coord):
+                        if not self.torus:
+                            continue
+                        coord = self.torus_adj(coord)
+                    coordinates.add(coord)
+            neighborhood = self._neighborhood_cache[key] = sorted(coordinates)
+        return neighborhood
+
+    def iter_neighborhood(self, pos, moore, include_center=False, radius=1):
+        yield from self.get_neighborhood(pos, moore, include_center, radius)
+
+    def place_agent(self, agent, pos):
+        pos = tuple(pos)
+        self.occupants.setdefault(pos, []).append(agent)
+        agent.pos = pos
+
+    def remove_agent(self, agent):
+        pos = agent.pos
+        cell = self.occupants[pos]
+        cell.remove(agent)
+        if not cell:
+            del self.occupants[pos]
+        agent.pos = None
+
+    def move_agent(self, agent, pos):
+        pos = self.torus_adj(tuple(pos))
+        self.remove_agent(agent)
+        self.place_agent(agent, pos)
+
+    def land_at(self, pos):
+        """LandCell of pos, or None if no land agent would be there."""
+        land_type = int(self.land_type[pos])
+        if land_type == NO_LAND:
+            return None
+        return LandCell(land_type, pos, self.land_elevation[pos].item())
+
+    def iter_cell_list_contents(self, cell_list):
+        if isinstance(cell_list, tuple) and len(cell_list) == 2 and not isinstance(cell_list[0], tuple):
+            cell_list = [cell_list]
+        for pos in cell_list:
+            pos = tuple(pos)
+            land = self.land_at(pos)
+            if land is not None:
+                yield land
+            yield from self.occupants.get(pos, ())
+
+    def get_cell_list_contents(self, cell_list):
+        return list(self.iter_cell_list_contents(cell_list))
+
+    def is_cell_empty(self, pos):
+        return self.land_type[pos] == NO_LAND and pos not in self.occupants
+
+    def coord_iter(self):
+        for x in range(self.width):
+            for y in range(self.height):
+                yield self.get_cell_list_contents([(x, y)]), x, y
@@ -0,0 +1,111 @@
+"""
+Structure-of-arrays engine for the wolves of a WolfModel
+
+WolfPack keeps the state of every wolf (age, alive, collar type/health, detected, position) in numpy arrays and
+advances all of them with one batched update per day, following the same rules as WolfAgent.step. The model still
+schedules one PackWolfAgent per wolf, which reads and writes its row of the arrays. Pack wolves are not placed on the
+MultiGrid, which would cost a Python list update per wolf per day.
+"""
+
+import numpy as np
+
+from metrics import clock
+
+# Moore neighbourhood including the centre, in the order MultiGrid.get_neighborhood sorts it away from the edges
+MOORE_OFFSETS = np.array([(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)])
+MOVE_LIKELIHOODS = [0.01, 0.55, 0.44]  # [random, target, average]
+
+
+class Pack():
+    """
+    Movement state of one pack of wolves: its feeding-site target, remaining path, centroid, feeding counter,
+    estimated position and last retreat.
+    """
+
+    def __init__(self, pack_id, target, sites):
+        self.pack_id = pack_id
+        self.target = target
+        self.path = [sites[target]]  # initialize the wolf path to a list of only the intial location
+        self.feeding = 0
+        self.avg_pos = np.array(sites[target], dtype=float)
+        self.tracked_position = np.array(sites[target], dtype=float)  # last estimate from the pack's detected wolves
+        self.retreated = None  # day the pack last gave way to a rival, see compute_territorial_retreats
+
+
+class WolfPack():
+    """Array state and batched step for all wolves of a model."""
+
+    def __init__(self, model, ages, collar_types, start, pack_ids=None, seed=None):
+        n = len(ages)
+        self.model = model
+        self.pack_id = np.zeros(n, dtype=np.int64) if pack_ids is None else np.asarray(pack_ids, dtype=np.int64)
+        self.age = np.asarray(ages, dtype=float)
+        self.alive = np.ones(n, dtype=bool)
+        self.collar_type = np.asarray(collar_types, dtype=np.int8)
+        self.collar_health = np.full(n, 100.0)
+        self.detected = np.zeros(n, dtype=bool)
+        self.pos = np.array(np.broadcast_to(np.asarray(start, dtype=np.int64), (n, 2)))
+        self.size = np.array([model.grid.width, model.grid.height])
+        self.rng = np.random.RandomState(seed)
+        self.agents = []
+
+    def __len__(self):
+        return len(self.age)
+
+    def step(self):
+        n = len(self)
+        # Chance that wolf is lost to health problems
+        self.alive &= ~(self.rng.randint(1, 10000, n) < 1)
+        living = self.alive.copy()
+        # Increase age by 1 day
+        self.age[living] += 1 / 365
+        # collar wear and tear, failure at 1%
+        self.model.collars.wear(self.collar_type, self.collar_health, living, self.model.time)
+        # each wolf heads for its own pack's next waypoint and centroid
+        waypoints = np.array([pack.path[0] for pack in self.model.packs], dtype=float)
+        centroids = np.array([pack.avg_pos for pack in self.model.packs], dtype=float)
+        metrics = self.model.metrics
+        start = clock() if metrics is not None else 0
+        self.move(living, waypoints[self.pack_id], centroids[self.pack_id])
+        if metrics is not None:
+            # counted per wolf, as the agent engine times WolfAgent.move
+            metrics.add("move", clock() - start, max(int(np.count_nonzero(living)), 1))
+
+    def move(self, living, target, average):
+        """Move the living wolves; target and average are (x, y) points or one point per wolf."""
+        index = np.nonzero(living)[0]
+        if len(index) == 0:
+            return
+        options = move_options(self.pos[index], self.size)
+        target, average = (per_wolf(point, index) for point in (target, average))
+        self.pos[index] = options[np.arange(len(index)), choose_moves(self.rng, options, target, average)]
+
+
+def per_wolf(point, index):
+    """(len(index), 2) points of the selected wolves from one (x, y) point or one point per wolf."""
+    point = np.asarray(point, dtype=float)
+    return point[index] if point.ndim == 2 else np.broadcast_to(point, (len(index), 2))
+
+
+def move_options(pos, size):
+    """Moore neighbourhood (with centre) of each wolf at pos (wolves, 2), wrapped on the torus: (wolves, 9, 2)."""
+    return (pos[:, None, :] + MOORE_OFFSETS[None, :, :]) % size
+
+
+def toward(options, points):
+    """Index of the option closest to each wolf's point, by squared distance, first one on ties as find_toward."""
+    offset = options - points[:, None, :]
+    return np.argmin(np.einsum("wok,wok->wo", offset, offset), axis=1)
+
+
+def choose_moves(rng, options, target, average):
+    """
+    Index among its options (wolves, 9, 2) of the cell each wolf moves to, as WolfAgent.move_decision chooses: a
+    random one, the one closest to its target or the one closest to its pack's average, with MOVE_LIKELIHOODS.
+    Both engines move their wolves with it; target and average are (wolves, 2).
+    """
+    count = len(options)
+    method = rng.choice(3, size=count, p=MOVE_LIKELIHOODS)
+    choice = rng.randint(0, len(MOORE_OFFSETS), count)
+    choice = np.where(method == 1, toward(options, target), choice)
+    return np.where(method == 2, toward(options, average), choice)
@@ -0,0 +1,122 @@
+"""
+Shortest-path planning for the wolf pack on the terrain lattice
+
+The 4-connected lattice of a TerrainContext is stored once as a sparse CSR adjacency matrix, and queries run
+scipy's compiled Dijkstra over it instead of walking a networkx graph of Python node objects. Paths to the feeding
+sites are served from a RouteCache of shortest-path trees rooted at each site.
+"""
+
+from collections import OrderedDict
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+
+
+class GridPathfinder():
+    """Shortest paths over the lattice weights of a (width, height) terrain, with cells numbered x * height + y."""
+
+    def __init__(self, horizontal_weights, vertical_weights):
+        width = horizontal_weights.shape[0] + 1
+        height = vertical_weights.shape[1] + 1
+        self.width = width
+        self.height = height
+        cells = np.arange(width * height).reshape(width, height)
+
+        # each undirected lattice edge is stored in both directions
+        rows = np.concatenate([cells[:-1, :].ravel(), cells[:, :-1].ravel()])
+        cols = np.concatenate([cells[1:, :].ravel(), cells[:, 1:].ravel()])
+        weights = np.concatenate([horizontal_weights.ravel(), vertical_weights.ravel()]).astype(float)
+        self.adjacency = csr_matrix((np.concatenate([weights, weights]),
+                                     (np.concatenate([rows, cols]), np.concatenate([cols, rows]))),
+                                    shape=(width * height, width * height))
+
+    def cell(self, pos):
+        return int(pos[0]) * self.height + int(pos[1])
+
+    def position(self, cell):
+        return divmod(int(cell), self.height)
+
+    def shortest_tree(self, source):
+        """Distances and predecessor array of the single-source shortest-path tree rooted at source."""
+        return dijkstra(self.adjacency, directed=False, indices=self.cell(source), return_predecessors=True)
+
+    def shortest_path(self, source, target):
+        """Cheapest path from source to target as a list of (x, y) tuples, both ends included."""
+        _, predecessors = self.shortest_tree(source)
+        return self.walk(predecessors, self.cell(target))[::-1]
+
+    def walk(self, predecessors, cell):
+        """Follow a predecessor array from cell back to the root of its tree."""
+        path = [self.position(cell)]
+        cell = predecessors[cell]
+        while cell >= 0:
+            path.append(self.position(cell))
+            cell = predecessors[cell]
+        return path
+
+    def path_cost(self, path):
+        cells = [self.cell(pos) for pos in path]
+        return float(sum(self.adjacency[a, b] for a, b in zip(cells[:-1], cells[1:])))
+
+
+class RouteCache():
+    """
+    Shortest-path trees rooted at target cells (the feeding sites), kept in a bounded LRU.
+
+    Each tree is found by searching backwards from the target, so its predecessor array gives the next step towards
+    the target from every cell and a path is a walk of the array, O(path length) instead of a search over the grid.
+    """
+
+    def __init__(self, pathfinder, sites=(), max_trees=None):
+        self.pathfinder = pathfinder
+        self.sites = tuple(sites)
+        self.max_trees = max_trees if max_trees is not None else max(len(self.sites), 1)
+        # paths run towards the root, so the search follows edges in reverse
+        self.reversed_adjacency = pathfinder.adjacency.transpose().tocsr()
+        self._trees = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def precompute(self):
+        """Build the trees of every feeding site up front, e.g. before forking batch workers."""
+        for site in self.sites[:self.max_trees]:
+            self.tree(site)
+
+    def tree(self, target):
+        """Predecessor array of the tree rooted at target: predecessors[cell] is the next cell towards target."""
+        target = (int(target[0]), int(target[1]))
+        if target in self._trees:
+            self.hits += 1
+            self._trees.move_to_end(target)
+            return self._trees[target]
+
+        self.misses += 1
+        _, predecessors = dijkstra(self.reversed_adjacency, directed=True, indices=self.pathfinder.cell(target),
+                                   return_predecessors=True)
+        predecessors = predecessors.astype(np.int32)
+        predecessors.setflags(write=False)
+        self._trees[target] = predecessors
+        while len(self._trees) > self.max_trees:
+            self._trees.popitem(last=False)
+        return predecessors
+
+    def path(self, source, target):
+        """Cheapest path from source to target as a list of (x, y) tuples, both ends included."""
+        return self.pathfinder.walk(self.tree(target), self.pathfinder.cell(source))
+
+    def paths(self, requests):
+        """
+        Serve a batch of (source, target) requests, e.g. from many packs retargeting in the same step. Duplicate
+        requests are resolved once and requests are grouped by target, so each tree is built at most once. Every path
+        returned is its own list.
+        """
+        resolved = {}
+        for source, target in sorted(set((tuple(map(int, s)), tuple(map(int, t))) for s, t in requests),
+                                     key=lambda request: request[1]):
+            resolved[(source, target)] = self.path(source, target)
+        return [list(resolved[(tuple(map(int, s)), tuple(map(int, t)))]) for s, t in requests]
+
+    def memory(self):
+        """Bytes held by the cached trees."""
+        return sum(tree.nbytes for tree in self._trees.values())
@@ -0,0 +1,198 @@
+"""
+Tracker placement optimization on recorded wolf trajectories
+
+Wolves do not react to the trackers, so a layout can be scored without rerunning the simulation: record_trajectory
+keeps, for every day of a run, the wolves' positions, which are alive and which wear a working collar, and
+LayoutEvaluator replays the trackers' side of WolfModel on those days (tracker_schedule, the range test, the
+detection rolls and the estimated pack position) for many candidate layouts at once. Detection rolls are drawn once
+per evaluator and shared by all candidates, so layouts are compared on the same luck.
+
+local_search and evolve search the positions of k trackers for the lowest average track error, and pareto_front
+runs the search for several tracker counts and keeps the counts that buy a lower error.
+"""
+
+from collections import namedtuple
+
+import numpy as np
+
+from detection import TRACKER_RANGES, TRACKER_TIMER, detection_chance, tracker_positions, tracker_schedule
+
+# daily snapshots of one run: pos (days, wolves, 2), living / collared (days, wolves), start (2,) first estimate
+Trajectory = namedtuple("Trajectory", ["pos", "living", "collared", "start"])
+# best layout (k, 2) and its average track error for one tracker count
+Placement = namedtuple("Placement", ["trackers", "error", "layout"])
+
+
+def record_trajectory(model, steps):
+    """
+    Run a model for steps days (one less model step: the last day's detection does not reach the statistics) and
+    return the state its trackers see each day.
+    """
+    start = np.array(model.tracked_position, dtype=float)
+    positions, living, collared = [], [], []
+    for day in range(steps):
+        if day:
+            model.step()
+        wolves = model.datacollector.sample_wolves(model)
+        alive = np.array(wolves["Alive"], dtype=bool)
+        collar = np.asarray(wolves["Collar"])
+        positions.append(np.array(wolves["Pos"], dtype=float).reshape(-1, 2))
+        living.append(alive)
+        collared.append(alive & ((collar == 1) | (collar == 2)))
+    return Trajectory(np.stack(positions), np.stack(living), np.stack(collared), start)
+
+
+def record_runs(kwargs, seeds, steps):
+    """Trajectories of one WolfModel scenario (kwargs) for each seed, seeded as batch runs are."""
+    from WolfsimModel import WolfModel
+
+    trajectories = []
+    for seed in seeds:
+        np.random.seed(seed % 2 ** 32)
+        trajectories.append(record_trajectory(WolfModel(**kwargs, seed=seed), steps))
+    return trajectories
+
+
+class LayoutEvaluator():
+    """Average track error of candidate layouts of one tracking type over a set of recorded trajectories."""
+
+    def __init__(self, trajectories, tracking_type, dist=None, timer=None, max_trackers=16, seed=0):
+        self.trajectories = list(trajectories)
+        self.tracking_type = tracking_type
+        self.dist = float(TRACKER_RANGES[tracking_type] if dist is None else dist)
+        self.timer = TRACKER_TIMER if timer is None else timer
+        self.max_trackers = max_trackers
+        rng = np.random.RandomState(seed)
+        # one detection roll per day, wolf and tracker slot, as detect_wolves draws them
+        self.rolls = [rng.randint(0, 100, trajectory.living.shape + (max_trackers,)).astype(np.int8)
+                      for trajectory in self.trajectories]
+        self.evaluations = 0
+
+    def scanning(self, day, trackers):
+        return [index for index in range(trackers) if tracker_schedule(self.tracking_type, day, self.timer, index)[1]]
+
+    def track_errors(self, layouts):
+        """Average track error of each layout, layouts shaped (candidates, trackers, 2); returns (candidates,)."""
+        layouts = np.asarray(layouts, dtype=float)
+        if layouts.ndim == 2:
+            layouts = layouts[None]
+        if layouts.shape[1] > self.max_trackers:
+            raise ValueError("layouts have more than max_trackers={} trackers".format(self.max_trackers))
+        self.evaluations += len(layouts)
+        errors = [self._replay(trajectory, rolls, layouts) for trajectory, rolls in zip(self.trajectories, self.rolls)]
+        return np.mean(errors, axis=0)
+
+    def _replay(self, trajectory, rolls, layouts):
+        candidates, trackers = layouts.shape[:2]
+        estimate = np.broadcast_to(trajectory.start, (candidates, 2)).copy()
+        total = np.zeros(candidates)
+        satellite = self.tracking_type == "satellite"
+        for day in range(len(trajectory.pos)):
+            positions = trajectory.pos[day]
+            scans = self.scanning(day, trackers) if day else []
+            collared = np.nonzero(trajectory.collared[day])[0]
+            if scans and len(collared):
+                found = positions[collared]
+                offset = layouts[:, scans, None, :] - found[None, None, :, :]
+                distance = np.sqrt(np.einsum("csnk,csnk->csn", offset, offset))
+                chance = detection_chance(satellite, distance, self.dist)
+                roll = rolls[day][collared][:, scans].T
+                detected = ((distance < self.dist) & (chance > roll[None])).any(axis=1)
+                counts = detected.sum(axis=1)
+                seen = counts > 0
+                estimate[seen] = (detected[seen] @ found) / counts[seen, None]
+            true_position = positions[trajectory.living[day]].mean(axis=0)
+            total += np.linalg.norm(true_position - estimate, axis=1)
+        return total / len(trajectory.pos)
+
+
+def random_layouts(rng, count, trackers, width, height):
+    return rng.randint(0, [width, height], (count, trackers, 2))
+
+
+def mutate(rng, layouts, scale, width, height):
+    """Move one random tracker of each layout by a Gaussian step (or, now and then, anywhere), wrapping the edges."""
+    layouts = np.array(layouts)
+    count, trackers = layouts.shape[:2]
+    index = rng.randint(0, trackers, count)
+    step = np.rint(rng.normal(0, scale, (count, 2))).astype(layouts.dtype)
+    jump = rng.random_sample(count) < 0.1
+    moved = layouts[np.arange(count), index] + step
+    moved[jump] = random_layouts(rng, int(jump.sum()), 1, width, height)[:, 0]
+    layouts[np.arange(count), index] = moved % [width, height]
+    return layouts
+
+
+def local_search(evaluator, trackers, width, height, start=None, iterations=50, candidates=32, scale=20.0, seed=0):
+    """
+    Hill climbing from start (random by default): each iteration scores candidates mutations of the best layout at
+    once, and the step scale shrinks after iterations without improvement. Returns (layout, error, history).
+    """
+    rng = np.random.RandomState(seed)
+    best = np.array(random_layouts(rng, 1, trackers, width, height)[0] if start is None else start, dtype=np.int64)
+    best_error = evaluator.track_errors(best[None])[0]
+    history = [best_error]
+    for _ in range(iterations):
+        children = mutate(rng, np.broadcast_to(best, (candidates,) + best.shape), scale, width, height)
+        errors = evaluator.track_errors(children)
+        if errors.min() < best_error:
+            best, best_error = children[errors.argmin()], errors.min()
+        else:
+            scale = max(1.0, scale * 0.7)
+        history.append(best_error)
+    return best, best_error, history
+
+
+def evolve(evaluator, trackers, width, height, initial=None, population=32, generations=40, scale=20.0, seed=0):
+    """
+    (mu + lambda) evolutionary search: each generation breeds a population of children by uniform crossover of
+    tournament-selected parents and mutation, and keeps the best of parents and children. initial layouts (e.g.
+    the current hand-placed one) join the random first population. Returns (layout, error, history).
+    """
+    rng = np.random.RandomState(seed)
+    layouts = random_layouts(rng, population, trackers, width, height)
+    if initial is not None:
+        initial = np.asarray(initial, dtype=np.int64).reshape(-1, trackers, 2)[:population]
+        layouts[:len(initial)] = initial
+    errors = evaluator.track_errors(layouts)
+    history = [errors.min()]
+    for _ in range(generations):
+        # binary tournaments pick the parents
+        pairs = rng.randint(0, population, (2, population, 2))
+        parents = np.where(errors[pairs[..., 0]] <= errors[pairs[..., 1]], pairs[..., 0], pairs[..., 1])
+        take_first = rng.random_sample((population, trackers)) < 0.5
+        children = np.where(take_first[..., None], layouts[parents[0]], layouts[parents[1]])
+        children = mutate(rng, children, scale, width, height)
+        child_errors = evaluator.track_errors(children)
+        layouts = np.concatenate([layouts, children])
+        errors = np.concatenate([errors, child_errors])
+        keep = np.argsort(errors, kind="stable")[:population]
+        layouts, errors = layouts[keep], errors[keep]
+        history.append(errors[0])
+    return layouts[0], errors[0], history
+
+
+def pareto_front(evaluator, counts, width, height, method="evolve", initial=None, **options):
+    """
+    Best layout found for each tracker count in counts, and the Pareto front of those: the counts whose error no
+    smaller count matches. initial maps a count to a starting layout. Returns (placements, front).
+    """
+    search = {"evolve": evolve, "local": local_search}[method]
+    placements = []
+    for trackers in counts:
+        start = (initial or {}).get(trackers)
+        if method == "evolve":
+            layout, error, _ = search(evaluator, trackers, width, height, initial=start, **options)
+        else:
+            layout, error, _ = search(evaluator, trackers, width, height, start=start, **options)
+        placements.append(Placement(trackers, float(error), [tuple(map(int, pos)) for pos in layout]))
+    front = []
+    for placement in sorted(placements, key=lambda p: (p.trackers, p.error)):
+        if not front or placement.error < front[-1].error:
+            front.append(placement)
+    return placements, front
+
+
+def default_layout(tracking_type, sites):
+    """The hand-placed layout WolfModel uses for a tracking type, as an array."""
+    return np.array(tracker_positions(tracking_type, sites), dtype=np.int64).reshape(-1, 2)
@@ -0,0 +1,117 @@
+"""
+Plotting for the Wolfsim model
+
+Everything here imports matplotlib on first use, so the simulation itself never loads it. PathPlotter and
+FrameExporter subscribe to a model's events (see events.py): the first draws each new pack route in an interactive
+window, the second saves wolf position maps as PNG files, rendered by a separate process so the simulation does not
+wait for matplotlib.
+"""
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+
+def _pyplot(backend=None):
+    import matplotlib
+    if backend is not None:
+        matplotlib.use(backend)
+    import matplotlib.pyplot as plt
+    return plt
+
+
+def position_counts(positions, alive, width, height):
+    """Number of living wolves on each cell, shape (width, height)."""
+    cells = np.asarray(positions, dtype=np.int64).reshape(-1, 2)[np.asarray(alive, dtype=bool)]
+    return np.bincount(cells[:, 0] * height + cells[:, 1], minlength=width * height).reshape(width, height)
+
+
+def render_positions(counts, time, filename):
+    """Save a wolf position map; runs in the exporter's worker process with a non-interactive backend."""
+    plt = _pyplot("Agg")
+    fig, ax = plt.subplots()
+    ax.imshow(counts, interpolation='nearest')
+    ax.set_title("Wolf position at time {}".format(time))
+    fig.savefig(filename)
+    plt.close(fig)
+    return filename
+
+
+class PathPlotter():
+    """Draws every new pack route over the tree and elevation layers ("path" subscriber)."""
+
+    def __init__(self, pause=3):
+        self.pause = pause
+
+    def attach(self, model):
+        model.events.subscribe("path", self)
+        return self
+
+    def __call__(self, model, pack, path):
+        plt = _pyplot()
+        x, y = zip(*path)
+        plt.scatter(y, x, marker='o')
+        plt.gca().invert_yaxis()
+        plt.imshow(model.tree, cmap='summer', interpolation='nearest', alpha=.5)
+        plt.imshow(model.grid_elevation, cmap='hot', interpolation='nearest')
+        plt.title("* PLEASE DO NOT CLOSE FIGURE* \n Wolfpack Optimal Paths")
+        plt.pause(self.pause)
+
+
+class FrameExporter():
+    """
+    Saves a map of the wolves' positions every `every` days as directory/wolf_positions_<day>.png ("positions"
+    subscriber). Frames are rendered in a worker process; at most max_pending frames are queued before the
+    simulation waits for the oldest one. Call close() to finish the queued frames.
+    """
+
+    def __init__(self, directory="results", every=25, max_pending=4):
+        self.directory = directory
+        self.every = every
+        self.max_pending = max_pending
+        self.pending = []
+        self.files = []
+        self._pool = None
+
+    def attach(self, model):
+        model.events.subscribe("positions", self)
+        return self
+
+    def _executor(self):
+        if self._pool is None:
+            os.makedirs(self.directory, exist_ok=True)
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context("fork" if "fork" in methods else None)
+            self._pool = ProcessPoolExecutor(max_workers=1, mp_context=context)
+        return self._pool
+
+    def __call__(self, model, time, positions, alive):
+        if time % self.every != 0:
+            return
+        counts = position_counts(positions, alive, model.grid.width, model.grid.height)
+        filename = os.path.join(self.directory, "wolf_positions_{}".format(time))
+        self.pending.append(self._executor().submit(render_positions, counts, time, filename))
+        while len(self.pending) > self.max_pending:
+            self.files.append(self.pending.pop(0).result())
+
+    def close(self):
+        for future in self.pending:
+            self.files.append(future.result())
+        self.pending = []
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+
+def plot_feeding_zones(model, startinglist):
+    plt = _pyplot()
+    feeding_zones = np.zeros((model.grid.width, model.grid.height))
+    for pos in startinglist:
+        feeding_zones[pos[0]][pos[1]] += 1
+
+    plt.imshow(feeding_zones, interpolation='nearest')
+    plt.title("Vegetation Map")
+    plt.colorbar()
+    plt.show()
@@ -0,0 +1,158 @@
+"""
+Streaming output of Wolfsim results
+
+A sink buffers rows column by column and writes them out one row group at a time, to Parquet when pyarrow is
+installed and to a CSV file appended chunk by chunk otherwise, so memory stays bounded however long a run is.
+AGENT_SCHEMA and MODEL_SCHEMA are the stable column layouts the ColumnarCollector streams per-wolf and per-step
+records in; batch runs write one row per run with columns taken from the first record. read_results reads a file
+back (memory-mapped for Parquet) and iter_result_chunks walks it a chunk at a time.
+"""
+
+import abc
+import os
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow is optional, results are written as CSV without it
+    pa = None
+    pq = None
+
+DEFAULT_ROW_GROUP = 1 << 16
+
+AGENT_SCHEMA = OrderedDict([("run", np.int64), ("step", np.int64), ("wolf", np.int64), ("x", np.int32),
+                            ("y", np.int32), ("alive", bool), ("age", np.float32), ("detected", bool),
+                            ("collar", np.int8)])
+MODEL_SCHEMA = OrderedDict([("run", np.int64), ("step", np.int64), ("health", np.float64), ("x", np.float64),
+                            ("y", np.float64), ("est_x", np.float64), ("est_y", np.float64),
+                            ("track_error", np.float64), ("average_track_error", np.float64)])
+
+
+def _column_dtype(value):
+    dtype = np.asarray(value).dtype
+    # fixed-width strings would truncate longer values in later rows
+    return np.dtype(object) if dtype.kind in "US" else dtype
+
+
+class ResultSink(abc.ABC):
+    """
+    Buffer of pending rows written out every row_group_size rows. columns maps column names to dtypes; when it is
+    None the columns and their types are taken from the first write.
+    """
+
+    def __init__(self, path, columns=None, row_group_size=DEFAULT_ROW_GROUP):
+        self.path = path
+        self.columns = None if columns is None else OrderedDict(columns)
+        self.row_group_size = row_group_size
+        self.rows = 0  # rows written to the file so far
+        self._pending = []
+        self._pending_rows = 0
+        self.closed = False
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, **columns):
+        """Append rows given as equal-length arrays (or scalars, repeated) keyed by column name."""
+        if self.columns is None:
+            self.columns = OrderedDict((name, _column_dtype(value)) for name, value in columns.items())
+        length = max(np.size(columns[name]) for name in self.columns)
+        chunk = OrderedDict((name, np.broadcast_to(np.asarray(columns[name], dtype=dtype), (length,)).copy())
+                            for name, dtype in self.columns.items())
+        self._pending.append(chunk)
+        self._pending_rows += length
+        if self._pending_rows >= self.row_group_size:
+            self.flush()
+
+    def flush(self):
+        if not self._pending_rows:
+            return
+        data = OrderedDict((name, np.concatenate([chunk[name] for chunk in self._pending])) for name in self.columns)
+        self._write_chunk(data)
+        self.rows += self._pending_rows
+        self._pending = []
+        self._pending_rows = 0
+
+    def close(self):
+        if self.closed:
+            return
+        self.flush()
+        self._close()
+        self.closed = True
+
+    @abc.abstractmethod
+    def _write_chunk(self, data):
+        """Write out data, an OrderedDict of equal-length column arrays."""
+
+    def _close(self):
+        pass
+
+
+class ParquetSink(ResultSink):
+    """Rows written as one Parquet row group per flush."""
+
+    def __init__(self, path, columns=None, row_group_size=DEFAULT_ROW_GROUP):
+        super().__init__(path, columns, row_group_size)
+        self._writer = None
+
+    def _write_chunk(self, data):
+        table = pa.Table.from_pydict(data)
+        if self._writer is None:
+            self._writer = pq.ParquetWriter(self.path, table.schema)
+        self._writer.write_table(table, row_group_size=self.row_group_size)
+
+    def _close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+class CsvSink(ResultSink):
+    """Rows appended to a CSV file one chunk per flush, with the header written once."""
+
+    def __init__(self, path, columns=None, row_group_size=DEFAULT_ROW_GROUP):
+        super().__init__(path, columns, row_group_size)
+        self._file = open(path, 'w', newline='')
+
+    def _write_chunk(self, data):
+        pd.DataFrame(data).to_csv(self._file, header=self.rows == 0, index=False)
+        self._file.flush()
+
+    def _close(self):
+        self._file.close()
+
+
+def open_sink(path, columns=None, row_group_size=DEFAULT_ROW_GROUP):
+    """
+    Parquet sink at path (with a .parquet extension) if pyarrow is available and path does not end in .csv,
+    otherwise a CSV sink at path with a .csv extension.
+    """
+    root, ext = os.path.splitext(path)
+    if ext == ".csv" or pq is None:
+        return CsvSink(root + ".csv", columns, row_group_size)
+    return ParquetSink(root + ".parquet", columns, row_group_size)
+
+
+def read_results(path, columns=None):
+    """Read a results file into a DataFrame; Parquet files are memory-mapped rather than read into buffers."""
+    if path.endswith(".parquet"):
+        return pq.read_table(path, columns=columns, memory_map=True).to_pandas()
+    return pd.read_csv(path, usecols=columns)
+
+
+def iter_result_chunks(path, chunk_rows=DEFAULT_ROW_GROUP, columns=None):
+    """DataFrames of at most chunk_rows rows covering a results file, for analysis that does not fit in memory."""
+    if path.endswith(".parquet"):
+        for batch in pq.ParquetFile(path, memory_map=True).iter_batches(batch_size=chunk_rows, columns=columns):
+            yield batch.to_pandas()
+    else:
+        for chunk in pd.read_csv(path, usecols=columns, chunksize=chunk_rows):
+            yield chunk
@@ -0,0 +1,249 @@
+"""
+Terrain loading for WolfSim
+
+Reads ESRI ASCII grids (elevation and vegetation) into typed numpy arrays and keeps a binary .npy copy of every
+parsed grid in a sidecar cache, so repeated runs and batch workers can memory-map the data instead of re-parsing text.
+Also holds the array versions of the layers derived from the terrain, such as the path planning edge weights.
+"""
+
+import hashlib
+import os
+from collections import namedtuple
+
+import numpy as np
+
+# Header of an ESRI ASCII grid. dx/dy fall back to cellsize for square-cell files.
+AsciiHeader = namedtuple("AsciiHeader", ["ncols", "nrows", "xllcorner", "yllcorner", "dx", "dy", "nodata_value",
+                                         "header_lines"])
+
+HEADER_KEYS = ("ncols", "nrows", "xllcorner", "yllcorner", "xllcenter", "yllcenter", "cellsize", "dx", "dy",
+               "nodata_value")
+
+ELEVATION_DTYPE = np.int16
+VEGETATION_DTYPE = np.uint8
+
+CACHE_DIR_NAME = ".terrain_cache"
+
+
+def read_header(path):
+    """Parse the key/value header at the top of an ESRI ASCII grid."""
+    values = {}
+    header_lines = 0
+    with open(path, 'r') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) != 2 or parts[0].lower() not in HEADER_KEYS:
+                break
+            values[parts[0].lower()] = parts[1]
+            header_lines += 1
+
+    if "ncols" not in values or "nrows" not in values:
+        raise ValueError("{} is not an ESRI ASCII grid (missing ncols/nrows)".format(path))
+
+    cellsize = float(values["cellsize"]) if "cellsize" in values else None
+    dx = float(values["dx"]) if "dx" in values else cellsize
+    dy = float(values["dy"]) if "dy" in values else cellsize
+    xll = values.get("xllcorner", values.get("xllcenter"))
+    yll = values.get("yllcorner", values.get("yllcenter"))
+    nodata = values.get("nodata_value")
+    return AsciiHeader(ncols=int(values["ncols"]),
+                       nrows=int(values["nrows"]),
+                       xllcorner=float(xll) if xll is not None else None,
+                       yllcorner=float(yll) if yll is not None else None,
+                       dx=dx,
+                       dy=dy,
+                       nodata_value=float(nodata) if nodata is not None else None,
+                       header_lines=header_lines)
+
+
+def file_digest(path, chunk_size=1 << 20):
+    sha = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def _cache_path(path, digest, dtype, cache_dir):
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(path)), CACHE_DIR_NAME)
+    name = "{}.{}.{}.npy".format(os.path.basename(path), digest[:16], np.dtype(dtype).name)
+    return os.path.join(cache_dir, name)
+
+
+def _parse_body(path, header, dtype):
+    data = np.loadtxt(path, dtype=np.float64, skiprows=header.header_lines, ndmin=2)
+    if data.shape != (header.nrows, header.ncols):
+        raise ValueError("{}: expected {}x{} cells, found {}x{}".format(
+            path, header.nrows, header.ncols, data.shape[0], data.shape[1]))
+    # rows are stored north to south; flip so that row 0 is the southern edge, as readASCII always did
+    return np.ascontiguousarray(data[::-1]).astype(dtype)
+
+
+def load_ascii_grid(path, dtype, cache=True, cache_dir=None):
+    """
+    Load an ESRI ASCII grid as a (nrows, ncols) array indexed [y][x] with row 0 at the southern edge.
+
+    With cache=True the parsed array is written to a .npy sidecar keyed on the file's hash and later loads are
+    memory-mapped read-only from it.
+    """
+    header = read_header(path)
+    if not cache:
+        return _parse_body(path, header, dtype), header
+
+    cached = _cache_path(path, file_digest(path), dtype, cache_dir)
+    if os.path.exists(cached):
+        try:
+            return np.load(cached, mmap_mode='r'), header
+        except (ValueError, OSError):
+            pass  # truncated or foreign file, rebuild it below
+
+    data = _parse_body(path, header, dtype)
+    try:
+        os.makedirs(os.path.dirname(cached), exist_ok=True)
+        # write then rename so parallel workers never see a half-written cache file
+        tmp = "{}.{}.tmp".format(cached, os.getpid())
+        with open(tmp, 'wb') as f:
+            np.save(f, data)
+        os.replace(tmp, cached)
+    except OSError:
+        return data, header
+    return np.load(cached, mmap_mode='r'), header
+
+
+def load_terrain(elevation_file, vegetation_file, cache=True, cache_dir=None):
+    """Load a matching elevation/vegetation pair, returning (elev, veg, width, height)."""
+    elev, elev_header = load_ascii_grid(elevation_file, ELEVATION_DTYPE, cache=cache, cache_dir=cache_dir)
+    veg, veg_header = load_ascii_grid(vegetation_file, VEGETATION_DTYPE, cache=cache, cache_dir=cache_dir)
+    if elev.shape != veg.shape:
+        raise ValueError("Elevation grid {} and vegetation grid {} have different sizes".format(
+            elev.shape, veg.shape))
+    return elev, veg, elev_header.ncols, elev_header.nrows
+
+
+# Path planning weights between neighbouring cells
+TREE_VALUE = 1 * 10
+ELEV_VALUE = 0.1 * 30
+BLOCKED_WEIGHT = 99999999
+
+
+def edge_weights(elevation, tree):
+    """
+    Weights of the 4-connected lattice over (width, height) arrays indexed [x, y].
+
+    Returns (horizontal, vertical): horizontal[x, y] joins (x, y)-(x+1, y) and vertical[x, y] joins (x, y)-(x, y+1).
+    Edges touching sea level or trees are blocked.
+    """
+    def weight(e0, e1, t0, t1):
+        blocked = (e0 + e1 < 2) | (t0 + t1 > 0)
+        cost = TREE_VALUE * (np.abs(t0 + t1 - 4)) + ELEV_VALUE * (np.abs(e0 - e1) / 2)
+        return np.where(blocked, BLOCKED_WEIGHT, cost)
+
+    horizontal = weight(elevation[:-1, :], elevation[1:, :], tree[:-1, :], tree[1:, :])
+    vertical = weight(elevation[:, :-1], elevation[:, 1:], tree[:, :-1], tree[:, 1:])
+    return horizontal, vertical
+
+
+class TerrainContext():
+    """
+    Read-only terrain layers shared by every WolfModel built on the same elevation/vegetation pair.
+
+    Arrays are indexed [x, y] (width, height). Use TerrainContext.get() to reuse an existing context instead of
+    rebuilding the path planning structures for every model in a batch.
+    """
+    _contexts = {}
+
+    def __init__(self, elev, veg, width, height, num_sites=8):
+        from environment import Elevation_Out_of_Bound, Vegetation
+
+        self.width = width
+        self.height = height
+        elev_values = np.asarray(elev, dtype=float)[:height, :width]
+        veg_values = np.asarray(veg, dtype=float)[:height, :width]
+
+        # column 0 is left at zero, as the original per-pixel fill skipped it
+        self.elevation = np.zeros((width, height))
+        self.elevation[1:, :] = elev_values[:, 1:].transpose()
+        self.tree = veg_values.transpose().copy()
+
+        self.out_of_bound = land_mask(elev_values, Elevation_Out_of_Bound)
+        self.vegetation = land_mask(veg_values, Vegetation)
+        ys, xs = np.nonzero(self.out_of_bound.transpose())
+        self.out_of_bound_cells = (xs, ys, elev_values[ys, xs])
+
+        # Agents will start out in high-probability areas: vegetation cells that are not out-of-bound,
+        # ordered row by row as the per-cell scan produced them
+        start_y, start_x = np.nonzero((self.vegetation & ~self.out_of_bound).transpose())
+        self.starting_cells = (start_x, start_y)
+        # limiting feeding sites to num_sites locations evenly spaced across the starting cells
+        site_indices = np.linspace(0, len(start_x) - 1, num_sites)
+        self.sites = tuple((int(start_x[int(ind)]), int(start_y[int(ind)])) for ind in site_indices)
+
+        self.horizontal_weights, self.vertical_weights = edge_weights(self.elevation, self.tree)
+        self._graph = None
+        self._pathfinder = None
+        self._routes = None
+
+        for array in (self.elevation, self.tree, self.out_of_bound, self.vegetation, self.horizontal_weights,
+                      self.vertical_weights, start_x, start_y) + self.out_of_bound_cells:
+            array.setflags(write=False)
+
+    @property
+    def pathfinder(self):
+        """Sparse-matrix shortest path engine over the lattice weights, built on first use."""
+        if self._pathfinder is None:
+            from pathfinding import GridPathfinder
+            self._pathfinder = GridPathfinder(self.horizontal_weights, self.vertical_weights)
+        return self._pathfinder
+
+    @property
+    def routes(self):
+        """Route cache of shortest-path trees to the feeding sites, shared by every model on this terrain."""
+        if self._routes is None:
+            from pathfinding import RouteCache
+            self._routes = RouteCache(self.pathfinder, self.sites)
+        return self._routes
+
+    @property
+    def graph(self):
+        """The lattice as a frozen networkx graph, built on first use. The model itself plans with pathfinder."""
+        if self._graph is None:
+            self._graph = self._build_graph()
+        return self._graph
+
+    def _build_graph(self):
+        import networkx as nx
+
+        G = nx.generators.lattice.grid_2d_graph(self.width, self.height, periodic=False)
+        weights = {}
+        for (x, y), weight in np.ndenumerate(self.horizontal_weights):
+            weights[((x, y), (x + 1, y))] = weight
+        for (x, y), weight in np.ndenumerate(self.vertical_weights):
+            weights[((x, y), (x, y + 1))] = weight
+        nx.set_edge_attributes(G, weights, 'weight')
+        return nx.freeze(G)
+
+    @classmethod
+    def get(cls, elev, veg, width, height, num_sites=8):
+        """Return the shared context for this terrain, building it on first use."""
+        sha = hashlib.sha1()
+        for grid in (elev, veg):
+            sha.update(np.ascontiguousarray(np.asarray(grid, dtype=float)).tobytes())
+        key = (sha.hexdigest(), width, height, num_sites)
+        if key not in cls._contexts:
+            cls._contexts[key] = cls(elev, veg, width, height, num_sites=num_sites)
+        return cls._contexts[key]
+
+
+def land_mask(values, land_type):
+    """Boolean (width, height) mask of the cells of a [y][x] grid belonging to land_type; column 0 is never set."""
+    values = np.asarray(values, dtype=float).transpose()
+    if land_type.__name__ == 'Elevation_Out_of_Bound':
+        # if elevation is not bounds but is within the bounds of the FNNR, mark as 'elevation OOB'
+        mask = ((values < land_type.lower_bound) | (values > land_type.upper_bound)) & (values != -9999)
+    elif land_type.__name__ == 'Vegetation':
+        mask = values == land_type.type
+    else:  # elevation background
+        mask = np.ones(values.shape, dtype=bool)
+    mask[0, :] = False
+    return mask
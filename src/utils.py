@@ -2,10 +2,14 @@
 Storage for util functions in WolfSim
 """
 
-from matplotlib import pyplot as plt
 import numpy as np
-import networkx as nx
-import scipy.stats as stats
+
+from terrain import load_ascii_grid
+
+# Packs heading for the same feeding site with centroids closer than this (in cells) compete for it
+TERRITORY_RADIUS = 10
+# Days a pack that gave way holds its new course before it can be made to retreat again
+RETREAT_COOLDOWN = 10
 
 
 class weibull_distribution():
@@ -25,9 +29,21 @@ def find_toward(lists, target):
     return new_position
 
 
+def wolf_positions(model, detected=False):
+    """(k, 2) array of the positions of living wolves, optionally only those currently detected."""
+    if model.pack is not None:
+        living = model.pack.alive & model.pack.detected if detected else model.pack.alive
+        return model.pack.pos[living]
+    if detected:
+        return np.array([agent.pos for agent in model.schedule.agents if (agent.alive == True and agent.detected == True)])
+    return np.array([agent.pos for agent in model.schedule.agents if agent.alive == True])
+
+
 def compute_pack_health(model):
     # agent_ages = [agent.age for agent in model.schedule.agents if agent.alive == True]
     # avgage = np.average(agent_ages)
+    if model.pack is not None:
+        return np.count_nonzero(model.pack.alive) / model.num_agents
     alive_cnt = 0
     for agent in model.schedule.agents:
         if agent.alive:
@@ -37,13 +53,19 @@ def compute_pack_health(model):
 
 
 def compute_pack_position(model):
-    agents_pos = [agent.pos for agent in model.schedule.agents if agent.alive == True]
+    # with several packs one centroid of all wolves may lie between them; the pack position is pack 0's
+    if len(model.packs) > 1:
+        return compute_pack_centroids(model)[0][0]
+    agents_pos = wolf_positions(model)
     avg_pos = np.average(agents_pos,axis=0)
     return avg_pos
 
 
 def compute_est_pack_position(model):
-    agents_pos = [agent.pos for agent in model.schedule.agents if (agent.alive == True and agent.detected == True)]
+    if len(model.packs) > 1:
+        model.tracked_position = compute_pack_tracking(model)[1][0]
+        return model.tracked_position
+    agents_pos = wolf_positions(model, detected=True)
     if len(agents_pos) < 1:
         avg_pos = model.tracked_position
     else:
@@ -53,6 +75,8 @@ def compute_est_pack_position(model):
 
 
 def compute_track_error(model):
+    if len(model.packs) > 1:
+        return mean_pack_error(compute_pack_tracking(model)[2])
     true_pos = compute_pack_position(model)
     track_pos = compute_est_pack_position(model)
     distance = np.linalg.norm(np.array(true_pos) - np.array(track_pos))
@@ -60,8 +84,7 @@ def compute_track_error(model):
 
 
 def compute_track_error_average(model):
-    now_error = compute_track_error(model)
-    model.track_error_sum += now_error
+    # the model adds each day's track error to track_error_sum as it steps
     track_error_average = model.track_error_sum / model.time
     return track_error_average
 
@@ -74,7 +97,7 @@ def compute_number_of_collars(model):
 
 
 def compute_updated_target(model):
-    agents_pos = [agent.pos for agent in model.schedule.agents if agent.alive]
+    agents_pos = wolf_positions(model)
     current_target = model.target
     distance = np.average(np.linalg.norm(np.array(agents_pos) - np.array(model.sites[current_target]),axis=1))
     distance = np.linalg.norm(np.average(np.array(agents_pos), axis=0) - np.array(model.sites[current_target]))
@@ -83,6 +106,7 @@ def compute_updated_target(model):
         model.feeding = model.feeding + 1
         if model.feeding >= 5:
             new_target = np.random.randint(0,len(model.sites)-1)
+            model.feeding = 0
         else:
             new_target = current_target
     else:
@@ -91,78 +115,131 @@ def compute_updated_target(model):
     return new_target
 
 
-def compute_updated_target_pathing(model, plot=False):
-    agents_pos = [agent.pos for agent in model.schedule.agents if agent.alive]
-    current_waypoint = model.path[0]
-    feeding_site = model.target
-    distance = np.linalg.norm(np.average(np.array(agents_pos), axis=0) - np.array(current_waypoint))
-    if distance <= 5.0 :
-        if len(model.path) == 1: # reached target position
-            model.feeding = model.feeding + 1
-            if model.feeding >= 5:
-                new_target = np.random.randint(0,len(model.sites)-1)
-                source = np.average(np.array(agents_pos), axis=0).astype(np.int)
-                source = tuple(source)
-                target = model.sites[new_target]
-                # Find shortest path for wolfpack travel using
-                # new_path = nx.algorithms.shortest_paths.generic.shortest_path(model.G, source=source, target=target,
-                #                                                       weight='weight')
-                new_path = nx.algorithms.shortest_paths.weighted.dijkstra_path(model.G, source=source, target=target,
-                                                                               weight='weight')
-                if plot:
-                    x, y = zip(*new_path)
-                    # print(y)
-                    plt.scatter(y, x, marker='o')
-                    plt.gca().invert_yaxis()
-                    plt.imshow(model.tree, cmap='summer', interpolation='nearest', alpha=.5)
-                    plt.imshow(model.grid_elevation, cmap='hot', interpolation='nearest')
-                    plt.title("* PLEASE DO NOT CLOSE FIGURE* \n Wolfpack Optimal Paths")
-                    # plt.show()
-                    plt.pause(3)
+def compute_pack_centroids(model, detected=False):
+    """
+    Centroid and number of living wolves of every pack, as (n_packs, 2) and (n_packs,) arrays, optionally of only
+    those currently detected.
+    """
+    n_packs = len(model.packs)
+    if model.pack is not None:
+        living = model.pack.alive & model.pack.detected if detected else model.pack.alive
+        positions, pack_ids = model.pack.pos[living], model.pack.pack_id[living]
+    else:
+        wolves = [agent for agent in model.schedule.agents
+                  if agent.type == 4 and agent.alive and (agent.detected or not detected)]
+        positions = np.array([wolf.pos for wolf in wolves]).reshape(-1, 2)
+        pack_ids = np.array([wolf.pack_id for wolf in wolves], dtype=int)
+    counts = np.bincount(pack_ids, minlength=n_packs)
+    sums = np.stack([np.bincount(pack_ids, weights=positions[:, k], minlength=n_packs) for k in (0, 1)], axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        centroids = sums / counts[:, None]
+    return centroids, counts
+
+
+def compute_pack_tracking(model):
+    """
+    Centroid, estimated position and track error of every pack, as (n_packs, 2), (n_packs, 2) and (n_packs,) arrays.
+    A pack's estimate is the centroid of its detected wolves, or its last estimate while none is detected; packs
+    without living wolves have a nan centroid and error.
+    """
+    centroids, counts = compute_pack_centroids(model)
+    detected, detected_counts = compute_pack_centroids(model, detected=True)
+    for pack in model.packs:
+        if detected_counts[pack.pack_id] > 0:
+            pack.tracked_position = detected[pack.pack_id]
+    estimates = np.array([pack.tracked_position for pack in model.packs], dtype=float)
+    errors = np.linalg.norm(centroids - estimates, axis=1)
+    return centroids, estimates, errors
+
+
+def mean_pack_error(errors):
+    """Track error of a multi-pack model: the mean of the errors of the packs that still have wolves."""
+    errors = errors[~np.isnan(errors)]
+    return errors.mean() if len(errors) else np.nan
+
+
+def compute_territorial_retreats(model, centroids, counts, radius=TERRITORY_RADIUS, cooldown=RETREAT_COOLDOWN):
+    """
+    Packs that give way to a rival: a pack retreats when a larger pack (or an equal one with a lower id) heading for
+    the same feeding site has its centroid within radius. A pack that retreated less than cooldown days ago holds its
+    course, so packs sent to the same contested site do not retreat again every day; the day of each retreat is
+    recorded on the pack.
+    """
+    if len(model.packs) < 2:
+        return []
+    ids = np.arange(len(model.packs))
+    holding = np.array([pack.retreated is not None and model.time - pack.retreated < cooldown
+                        for pack in model.packs])
+    targets = np.array([pack.target for pack in model.packs])
+    distances = np.linalg.norm(centroids[:, None, :] - centroids[None, :, :], axis=2)
+    rivals = (distances <= radius) & (targets[:, None] == targets[None, :]) & (ids[:, None] != ids[None, :])
+    weaker = (counts[:, None] < counts[None, :]) | ((counts[:, None] == counts[None, :]) & (ids[:, None] > ids[None, :]))
+    retreat = np.any(rivals & weaker, axis=1) & (counts > 0) & ~holding
+    retreating = [model.packs[p] for p in np.nonzero(retreat)[0]]
+    for pack in retreating:
+        pack.retreated = model.time
+    return retreating
+
+
+def feeding_site_candidates(num_sites, taken, leaving=None):
+    """
+    Sites a pack may head for: never the site it is leaving (done feeding or giving way) while there is another, and
+    none of the sites other packs are heading for (taken) while a free one is left. The last site is never a target.
+    """
+    sites = [site for site in range(num_sites - 1) if site != leaving] or [leaving]
+    return [site for site in sites if site not in taken] or sites
+
+
+def choose_feeding_site(model, pack, rng=np.random):
+    taken = [other.target for other in model.packs if other is not pack]
+    candidates = feeding_site_candidates(len(model.sites), taken, leaving=pack.target)
+    return candidates[rng.randint(0, len(candidates))]
+
+
+def compute_updated_target_pathing(model):
+    """
+    Move every pack along its path, and route packs that are done feeding (or give way to a rival pack) to a new
+    feeding site. Route requests of all packs are served together, and each new route is published as a "path"
+    event. Returns the target and path of the first pack.
+    """
+    centroids, counts = compute_pack_centroids(model)
+    retargeting = []
+    for pack in model.packs:
+        if counts[pack.pack_id] == 0:
+            continue
+        pack.avg_pos = centroids[pack.pack_id]
+        current_waypoint = pack.path[0]
+        distance = np.linalg.norm(pack.avg_pos - np.array(current_waypoint))
+        if distance <= 5.0 :
+            if len(pack.path) == 1: # reached target position
+                pack.feeding = pack.feeding + 1
+                if pack.feeding >= 5:
+                    retargeting.append(pack)
             else:
-                new_target = feeding_site
-                new_path = model.path
+                pack.path.pop(0)
         else:
-            model.path.pop(0)
-            new_path = model.path
-            new_target = feeding_site
-    else:
-        model.feeding = 0
-        new_target = feeding_site
-        new_path = model.path
-
-    return new_target, new_path
-
-
-def plot_agent_positions(model, fig, ax):
-    agent_counts = np.zeros((model.grid.width, model.grid.height))
-    for wolf in model.schedule.agents:
-        pos = wolf.pos
-        agent_counts[pos[0]][pos[1]] += 1
-
-    ax.imshow(agent_counts, interpolation='nearest')
-    # ax.set_title("Wolf position at time {}".format(model.time))
-    plt.title("Wolf position at time {}".format(model.time))
-    # ax.colorbar()
-    fig.savefig("results/wolf_positions_{}".format(model.time))
-    # plt.show()
-    # plt.pause(0.1)
-
-
-def plot_feeding_zones(model, startinglist):
-    feeding_zones = np.zeros((model.grid.width, model.grid.height))
-    # for cell in model.grid.coord_iter():
-    #     cell_content, x, y = cell
-    #     agent_count = len(cell_content)
-    #     agent_counts[x][y] = agent_count
-    for pos in startinglist:
-        feeding_zones[pos[0]][pos[1]] += 1
-
-    plt.imshow(feeding_zones, interpolation='nearest')
-    plt.title("Vegetation Map")
-    plt.colorbar()
-    plt.show()
-    # plt.pause(0.1)
+            pack.feeding = 0
+
+    for pack in compute_territorial_retreats(model, centroids, counts):
+        if pack not in retargeting:
+            retargeting.append(pack)
+
+    if retargeting:
+        requests = []
+        for pack in retargeting:
+            pack.target = choose_feeding_site(model, pack)
+            pack.feeding = 0
+            source = tuple(pack.avg_pos.astype(int))
+            requests.append((source, model.sites[pack.target]))
+        # Find shortest paths for wolfpack travel from the cached shortest-path trees of the feeding sites
+        for pack, new_path in zip(retargeting, model.routes.paths(requests)):
+            pack.path = new_path
+            if model.metrics is not None:
+                model.metrics.route(new_path)
+            if model.events.wants("path"):
+                model.events.emit("path", model=model, pack=pack, path=new_path)
+
+    return model.packs[0].target, model.packs[0].path
 
 
 def readCSV(text):
@@ -175,87 +252,33 @@ def readCSV(text):
 
 
 def readASCII(text, version):
-    if version == "new":
-        # reads in a text file that determines the environmental grid setup from ABM
-        f = open(text, 'r')
-        body = f.readlines()
-        width = body[0][-4:-1]  # last 4 characters of line that contains the 'width' value
-        height = body[1][-5:-1]
-        abody = body[7:]  # ASCII file with a header
-        f.close()
-        abody = reversed(abody)
-        cells = []
-        for line in abody:
-            cells.append(line.replace("\n","").split(" "))
-        return [cells, int(width), int(height)]
-    elif version == "old":
-        # reads in a text file that determines the environmental grid setup from ABM
-        f = open(text, 'r')
-        body = f.readlines()
-        width = body[0][-4:]  # last 4 characters of line that contains the 'width' value
-        height = body[1][-5:]
-        abody = body[6:]  # ASCII file with a header
-        f.close()
-        abody = reversed(abody)
-        cells = []
-        for line in abody:
-            cells.append(line.split(" "))
-        return [cells, int(width), int(height)]
-    else:
+    # reads in an ESRI ASCII file that determines the environmental grid setup from ABM
+    # the header is parsed by key, so "new" (dx/dy) and "old" (cellsize) layouts load the same way
+    if version not in ("new", "old"):
         raise ValueError("Version should 'new' or 'old'")
-
-
-def home_range(wolfsim_data):
-    positions = wolfsim_data['Pack Position']
-    positions_tracked = wolfsim_data['Pack Estimated Position']
-    # vals, cnts = np.unique(positions, return_counts=True)
-    points = np.zeros((len(positions),2))
-    points_tracked = np.zeros((len(positions),2))
-    for i in range(0,len(positions)):
-        points[i][0] = positions.iloc[i][0]
-        points[i][1] = positions.iloc[i][1]
-        points_tracked[i][0] = positions_tracked.iloc[i][0]
-        points_tracked[i][1] = positions_tracked.iloc[i][1]
-    # kde = stats.gaussian_kde(points.transpose(), bw_method=None, weights=cnts, )
-    kde = stats.gaussian_kde(points.transpose(), bw_method=None)
-    kde_tracked = stats.gaussian_kde(points_tracked.transpose(), bw_method=None)
-
-    mins = np.min(points,axis=0)
-    xmin = mins[0]
-    ymin = mins[1]
-    maxs = np.max(points,axis=0)
-    xmax = maxs[0]
-    ymax = maxs[1]
-
-    X,Y = np.mgrid[xmin:xmax:100j, ymin:ymax:100j]
-    testpts = np.vstack([X.ravel(), Y.ravel()])
-    Z = np.reshape(kde(testpts), X.shape)
-
-    fig, ax = plt.subplots()
-    ax.imshow(np.rot90(Z), cmap=plt.cm.gist_earth_r,
-              extent=[xmin, xmax, ymin, ymax])
-    ax.plot(points[:,0], points[:,1], 'k.', markersize=2)
-    ax.set_xlim([xmin, xmax])
-    ax.set_ylim([ymin, ymax])
-    # plt.show()
-
-    mins2 = np.min(points_tracked,axis=0)
-    xmin2 = mins2[0]
-    ymin2 = mins2[1]
-    maxs2 = np.max(points_tracked,axis=0)
-    xmax2 = maxs2[0]
-    ymax2 = maxs2[1]
-
-    X2,Y2 = np.mgrid[xmin2:xmax2:100j, ymin2:ymax2:100j]
-    testpts2 = np.vstack([X2.ravel(), Y2.ravel()])
-    Z_tracked = np.reshape(kde_tracked(testpts2), X.shape)
-    fig2, ax2 = plt.subplots()
-    ax2.imshow(np.rot90(Z_tracked), cmap=plt.cm.gist_earth_r,
-              extent=[xmin2, xmax2, ymin2, ymax2])
-    ax2.plot(points_tracked[:,0], points_tracked[:,1], 'k.', markersize=2)
-    ax2.set_xlim([xmin2, xmax2])
-    ax2.set_ylim([ymin2, ymax2])
-    plt.show()
+    cells, header = load_ascii_grid(text, np.float64)
+    return [cells, header.ncols, header.nrows]
+
+
+def home_range(wolfsim_data, width=None, height=None, plot=False):
+    """
+    50%/95% home ranges of the true and the tracked pack positions in a model-vars dataframe, estimated on the
+    width x height grid (the extent of the positions, without wrap-around, if not given). With plot=True both UDs are
+    drawn with their contours; showing the figures is left to the caller.
+    """
+    from homerange import estimate_home_range, plot_home_range
+
+    points = np.stack(wolfsim_data['Pack Position'].values).astype(float)
+    points_tracked = np.stack(wolfsim_data['Pack Estimated Position'].values).astype(float)
+    torus = width is not None and height is not None
+    if not torus:
+        width, height = (np.ceil(np.max(np.vstack([points, points_tracked]), axis=0)) + 1).astype(int)
+    ranges = {"true": estimate_home_range(points, width, height, torus=torus),
+              "tracked": estimate_home_range(points_tracked, width, height, torus=torus)}
+    if plot:
+        plot_home_range(ranges["true"], points, title="Pack home range")
+        plot_home_range(ranges["tracked"], points_tracked, title="Tracked home range")
+    return ranges
 
 
 def agent_portrayal(agent):
@@ -0,0 +1,113 @@
+"""
+Browser visualization of a running WolfModel for Mesa's ModularServer
+
+CanvasGrid portrays and serializes every agent of every cell on every frame, the out-of-bound land agents
+included, so its frames grow with the map. RasterGrid sends the terrain once per model, as a PNG of the elevation,
+vegetation and out-of-bound cells with the feeding sites and tracker positions, and from then on only the wolves and
+trackers whose state changed since the last frame. RasterModule.js keeps the state in the browser and redraws it
+over the cached image, so a frame costs the number of moving agents, not the size of the map.
+"""
+
+import base64
+import struct
+import zlib
+
+import numpy as np
+from mesa.visualization.ModularVisualization import VisualizationElement
+
+# wolf states sent to the browser, drawn as agent_portrayal draws them (black, red when detected, blue when dead)
+WOLF_ALIVE = 0
+WOLF_DETECTED = 1
+WOLF_DEAD = 2
+
+OUT_OF_BOUND_COLOR = (0, 0, 0)
+OUTSIDE_COLOR = (255, 255, 255)
+VEGETATION_TINT = (60, 140, 60)
+
+
+def terrain_colors(terrain):
+    """(width, height, 3) uint8 colors of a TerrainContext: grey elevation, green vegetation, black out of bounds."""
+    elevation = np.asarray(terrain.elevation, dtype=float)
+    inside = ~terrain.out_of_bound & (elevation != -9999)
+    low, high = (elevation[inside].min(), elevation[inside].max()) if inside.any() else (0.0, 1.0)
+    shade = 110 + 145 * np.clip((elevation - low) / max(high - low, 1e-9), 0, 1)
+    colors = np.repeat(shade[..., None], 3, axis=2)
+    colors[terrain.vegetation] = 0.5 * colors[terrain.vegetation] + 0.5 * np.array(VEGETATION_TINT)
+    colors[elevation == -9999] = OUTSIDE_COLOR
+    colors[terrain.out_of_bound] = OUT_OF_BOUND_COLOR
+    return np.rint(colors).astype(np.uint8)
+
+
+def encode_png(rgb):
+    """PNG bytes of an (rows, columns, 3) uint8 image; the standard library is enough for the terrain image."""
+    rgb = np.ascontiguousarray(rgb, dtype=np.uint8)
+    rows, columns = rgb.shape[:2]
+
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff)
+
+    # every scanline starts with filter type 0 (none)
+    raw = np.concatenate([np.zeros((rows, 1), dtype=np.uint8), rgb.reshape(rows, -1)], axis=1).tobytes()
+    return (b"\x89PNG\r\n\x1a\n"
+            + chunk(b"IHDR", struct.pack(">IIBBBBB", columns, rows, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(raw, 6))
+            + chunk(b"IEND", b""))
+
+
+def terrain_image(terrain):
+    """Data URI of the terrain PNG, one pixel per cell, y = 0 in the bottom row as CanvasGrid draws the grid."""
+    png = encode_png(terrain_colors(terrain).transpose(1, 0, 2)[::-1])
+    return "data:image/png;base64," + base64.b64encode(png).decode("ascii")
+
+
+def wolf_states(model):
+    """(wolves, 3) int array of each wolf's x, y and WOLF_* state."""
+    wolves = model.datacollector.sample_wolves(model)
+    alive = np.asarray(wolves["Alive"], dtype=bool)
+    state = np.where(alive, np.where(np.asarray(wolves["Detected"], dtype=bool), WOLF_DETECTED, WOLF_ALIVE), WOLF_DEAD)
+    positions = np.asarray(wolves["Pos"], dtype=np.int64).reshape(-1, 2)
+    return np.column_stack([positions, state])
+
+
+class RasterGrid(VisualizationElement):
+    """
+    Drop-in replacement for CanvasGrid(agent_portrayal, ...) in viz_run. The first frame of every model (the server
+    builds a new one on reset) carries the terrain image; later frames carry [index, x, y, state] of the wolves and
+    [index, active] of the trackers that changed.
+    """
+    local_includes = ["RasterModule.js"]
+
+    def __init__(self, grid_width, grid_height, canvas_width=500, canvas_height=500):
+        self.grid_width = grid_width
+        self.grid_height = grid_height
+        self.canvas_width = canvas_width
+        self.canvas_height = canvas_height
+        self.js_code = "elements.push(new RasterModule({}, {}, {}, {}));".format(
+            canvas_width, canvas_height, grid_width, grid_height)
+        self._model = None
+        self._images = {}  # terrain image per TerrainContext, reused across resets
+        self._wolves = None
+        self._active = None
+
+    def render(self, model):
+        wolves = wolf_states(model)
+        active = np.array([tracker.active for tracker in model.trackers], dtype=bool)
+        if model is not self._model:
+            frame = self.full_frame(model, wolves, active)
+        else:
+            moved = np.nonzero((wolves != self._wolves).any(axis=1))[0]
+            switched = np.nonzero(active != self._active)[0]
+            frame = {"wolves": np.column_stack([moved, wolves[moved]]).tolist(),
+                     "trackers": [[int(index), bool(active[index])] for index in switched]}
+        self._model, self._wolves, self._active = model, wolves, active
+        return frame
+
+    def full_frame(self, model, wolves, active):
+        image = self._images.get(id(model.terrain))
+        if image is None:
+            image = self._images[id(model.terrain)] = terrain_image(model.terrain)
+        return {"background": image,
+                "sites": [list(site) for site in model.sites],
+                "tracker_positions": [list(tracker.pos) + [float(tracker.dist)] for tracker in model.trackers],
+                "wolves": np.column_stack([np.arange(len(wolves)), wolves]).tolist(),
+                "trackers": [[index, bool(value)] for index, value in enumerate(active.tolist())]}
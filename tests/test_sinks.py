@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+
+from sinks import AGENT_SCHEMA, ResultSink, iter_result_chunks, open_sink, read_results
+
+
+def test_sink_without_write_chunk_cannot_be_created(tmp_path):
+    class IncompleteSink(ResultSink):
+        pass
+
+    with pytest.raises(TypeError):
+        IncompleteSink(str(tmp_path / "results"))
+
+
+def test_parquet_round_trip_keeps_schema(tmp_path):
+    pytest.importorskip("pyarrow")
+    rows = 10
+    columns = {name: np.arange(rows).astype(dtype) for name, dtype in AGENT_SCHEMA.items()}
+    # three row groups, the last one partial, written across several writes
+    with open_sink(str(tmp_path / "agents"), AGENT_SCHEMA, row_group_size=4) as sink:
+        sink.write(**{name: values[:3] for name, values in columns.items()})
+        sink.write(**{name: values[3:] for name, values in columns.items()})
+    assert sink.path.endswith(".parquet")
+    assert sink.rows == rows
+
+    frame = read_results(sink.path)
+    assert list(frame.columns) == list(AGENT_SCHEMA)
+    for name, dtype in AGENT_SCHEMA.items():
+        assert frame[name].dtype == np.dtype(dtype)
+        np.testing.assert_array_equal(frame[name].to_numpy(), columns[name])
+    assert [len(chunk) for chunk in iter_result_chunks(sink.path, chunk_rows=4)] == [4, 4, 2]